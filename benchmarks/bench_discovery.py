@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Compares replay discovery against the iterdir / glob / is_zipfile walk it
+# replaced
+# Builds a synthetic tree of sets (replays plus the other files Slippi and
+# Replay Manager leave around, and some zips), or walks an existing one with
+# --path, e.g. a network share. Both walks must find the same replays.
+#
+#   python benchmarks/bench_discovery.py --dirs 2000 --threads 1 8
+#   python benchmarks/bench_discovery.py --path /mnt/share/replays --zip
+#
+# The OS caches directory listings, so every walk after the first one on a
+# tree runs warm; the first walk is discarded.
+
+import argparse
+import pathlib
+import tempfile
+import time
+import zipfile
+
+import slp2mp4.discovery as discovery
+import slp2mp4.util as util
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Benchmark replay discovery")
+    parser.add_argument("--path", type=pathlib.Path, help="walk this tree instead")
+    parser.add_argument("--dirs", type=int, default=1000, help="synthetic sets")
+    parser.add_argument("--files", type=int, default=5, help="replays per set")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--zip", action="store_true", help="also look for zips")
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def make_tree(root: pathlib.Path, dirs: int, files: int):
+    for i in range(dirs):
+        set_dir = root / f"event{i // 100}" / f"set{i}"
+        set_dir.mkdir(parents=True)
+        for j in range(files):
+            (set_dir / f"Game_{j}.slp").write_bytes(b"")
+        (set_dir / "context.json").write_text("{}")
+        (set_dir / "cover.png").write_bytes(b"")
+        if i % 50 == 0:
+            with zipfile.ZipFile(set_dir.parent / f"set{i}.zip", "w") as zfile:
+                zfile.writestr("Game_0.slp", b"")
+
+
+# How discovery used to walk directories
+def _legacy_directory(location, path, found):
+    if not path.is_dir():
+        return
+    slps = sorted(path.glob("*.slp"), key=util.natsort)
+    if slps:
+        found[location] = slps
+    for child in path.iterdir():
+        _legacy_directory(location / child.name, child, found)
+
+
+# How zip mode used to find zips; the zips' contents were read the same way
+def _legacy_zip(location, path, found):
+    for child in path.iterdir():
+        if child.is_dir():
+            _legacy_zip(location / child.name, child, found)
+        elif zipfile.is_zipfile(child):
+            found[location / child.name] = child
+
+
+def legacy_walk(path, find_zips):
+    found = {}
+    root = pathlib.Path(path.name)
+    if find_zips:
+        _legacy_zip(root, path, found)
+    else:
+        _legacy_directory(root, path, found)
+    return found
+
+
+def walk(path, find_zips, threads):
+    found = {}
+    for result in discovery.walk(path, pathlib.Path(path.name), find_zips, threads):
+        if find_zips:
+            for zip_path in result.zips:
+                found[result.location / zip_path.name] = zip_path
+        elif result.slps:
+            found[result.location] = result.slps
+    return found
+
+
+def time_walk(args, walker, *walker_args):
+    walker(*walker_args)  # Warm up
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        found = walker(*walker_args)
+        times.append(time.perf_counter() - start)
+    return min(times), found
+
+
+def run(args, path: pathlib.Path):
+    legacy_time, expected = time_walk(args, legacy_walk, path, args.zip)
+    kind = "zips" if args.zip else "sets"
+    print(f"{len(expected)} {kind} found")
+    print(f"{'walker':>12} {'time (s)':>9} {'speedup':>8}")
+    print(f"{'legacy':>12} {legacy_time:>9.3f} {1:>8.2f}")
+    for threads in args.threads:
+        walk_time, found = time_walk(args, walk, path, args.zip, threads)
+        if found != expected:
+            raise AssertionError(
+                f"Walk with {threads} thread(s) found different {kind}"
+            )
+        name = f"scandir x{threads}"
+        print(f"{name:>12} {walk_time:>9.3f} {legacy_time / walk_time:>8.2f}")
+
+
+def main():
+    args = get_args()
+    if args.path is not None:
+        run(args, args.path)
+        return
+    with tempfile.TemporaryDirectory() as tmpdir_str:
+        root = pathlib.Path(tmpdir_str) / "replays"
+        make_tree(root, args.dirs, args.files)
+        run(args, root)
+
+
+if __name__ == "__main__":
+    main()
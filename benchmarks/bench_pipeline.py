@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Measures how the pipeline scales with the number of render workers
+# Runs a synthetic batch through the real orchestrator with the fake Dolphin /
+# ffmpeg from this directory, so no ISO or Slippi install is needed, then
+# checks every video was assembled from the right games in the right order.
+#
+#   python benchmarks/bench_pipeline.py --workers 1 2 4 8
+#
+# Speedups are relative to the first worker count. "dolphin busy" is the share
+# of worker time spent playing replays; the rest is pipeline overhead (process
+# startup, queues, muxing, scheduling gaps).
+
+import argparse
+import json
+import os
+import pathlib
+import re
+import sys
+import tempfile
+import time
+
+import slp2mp4.config as config
+import slp2mp4.orchestrator as orchestrator
+import slp2mp4.scratch as scratch
+import slp2mp4.util as util
+from slp2mp4.modes.directory import Directory
+
+import make_replays
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+_SLP_NAME = re.compile(rb"[^\x00\n]+\.slp(?=\n)")
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the slp2mp4 pipeline with fake Dolphin / ffmpeg"
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sets", type=int, default=8)
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=1800, help="frames per game")
+    parser.add_argument(
+        "--fps", type=float, default=3600, help="fake Dolphin speed (0 = unlimited)"
+    )
+    parser.add_argument("--boot", type=float, default=0.5, help="fake boot time")
+    parser.add_argument("--persistent", action="store_true")
+    parser.add_argument("--stream-dumps", action="store_true")
+    parser.add_argument("--progressive", action="store_true")
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--json", type=pathlib.Path, help="write results here")
+    return parser.parse_args()
+
+
+def get_config(args, workdir: pathlib.Path, workers: int) -> dict:
+    iso = workdir / "melee.iso"
+    iso.touch()
+    conf = config.get_default_config()
+    util.update_dict(
+        conf,
+        {
+            "paths": {
+                "ffmpeg": str(BENCH_DIR / "fake_ffmpeg.py"),
+                "slippi_playback": str(BENCH_DIR / "fake_dolphin.py"),
+                "ssbm_iso": str(iso),
+            },
+            "dolphin": {
+                "persistent": args.persistent,
+                "stream_dumps": args.stream_dumps,
+            },
+            "runtime": {
+                "parallel": workers,
+                "adaptive": args.adaptive,
+                "progressive_sets": args.progressive,
+                "retries": 0,
+            },
+            "cache": {
+                "enabled": False,
+            },
+            "report": {
+                "json": str(workdir / "report.json"),
+                "prometheus": "",
+            },
+        },
+    )
+    config.translate_and_validate_config(conf)
+    return conf
+
+
+# Each fake dump starts with its replay's path, so a video's replays can be
+# read back out of it
+def verify(outputs):
+    for output in outputs:
+        names = []
+        for name in _SLP_NAME.findall(output.output.read_bytes()):
+            if not names or names[-1] != name:
+                names.append(name)
+        expected = [str(slp.absolute()).encode() for slp in output.inputs]
+        if names != expected:
+            raise AssertionError(f"{output.output} has the wrong games: {names}")
+
+
+def run(args, workers: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir_str:
+        workdir = pathlib.Path(workdir_str)
+        make_replays.make_batch(workdir / "replays", args.sets, args.games, args.frames)
+        conf = get_config(args, workdir, workers)
+        mode = Directory([workdir / "replays"], workdir / "out")
+        mode.conf = conf
+        outputs = mode.get_outputs()
+        mode.output_directory.mkdir()
+
+        with scratch.open_run(conf) as run_scratch:
+            start = time.perf_counter()
+            failures = orchestrator.run(conf, outputs, run_scratch)
+            wall = time.perf_counter() - start
+        if failures:
+            raise RuntimeError(orchestrator.summarize_failures(failures))
+        verify(outputs)
+
+        report = json.loads((workdir / "report.json").read_text())
+        stages = report["game_stages"]
+        dolphin = stages.get("dolphin", stages.get("stream", {})).get("total", 0)
+        return {
+            "workers": workers,
+            "wall": wall,
+            "games": report["games_rendered"],
+            "games_per_hour": report["games_rendered"] * 3600 / wall,
+            "frames_per_second": report["frames"] / wall,
+            "dolphin_busy": dolphin / (wall * workers),
+            "queue_wait": stages["queue_wait"]["mean"],
+            "game_stages": stages,
+            "set_stages": report["set_stages"],
+            "worker_limits": report["worker_limits"],
+        }
+
+
+def main():
+    args = get_args()
+    os.environ["SLP2MP4_FAKE_FPS"] = str(args.fps)
+    os.environ["SLP2MP4_FAKE_BOOT"] = str(args.boot)
+
+    results = []
+    print(
+        f"{'workers':>7} {'wall (s)':>9} {'games/h':>9} {'frames/s':>9} "
+        f"{'speedup':>8} {'dolphin busy':>13} {'queue wait (ms)':>16}"
+    )
+    for workers in args.workers:
+        result = run(args, workers)
+        results.append(result)
+        speedup = results[0]["wall"] / result["wall"]
+        print(
+            f"{workers:>7} {result['wall']:>9.2f} {result['games_per_hour']:>9.0f} "
+            f"{result['frames_per_second']:>9.0f} {speedup:>8.2f} "
+            f"{result['dolphin_busy']:>13.0%} {result['queue_wait'] * 1000:>16.1f}"
+        )
+        sys.stdout.flush()
+
+    if args.json is not None:
+        data = {"args": vars(args), "results": results}
+        args.json.write_text(json.dumps(data, indent=1, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Stand-in for Slippi Dolphin's playback build
+# Takes the same flags as DolphinRunner passes, "plays" the replay named in the
+# comm file by printing [GAME_END_FRAME] / [CURRENT_FRAME] lines, and writes
+# small dump files that name the replay, so the final videos can be checked.
+# Like the real thing, it keeps running once the replay is over, and loads the
+# next replay whenever the comm file's commandId changes.
+#
+# Environment:
+#   SLP2MP4_FAKE_FPS: frames played per second (0 = as fast as possible)
+#   SLP2MP4_FAKE_BOOT: seconds spent booting before the first replay
+#   SLP2MP4_FAKE_DUMP_BYTES: bytes of video dumped per frame
+
+import argparse
+import json
+import os
+import pathlib
+import sys
+import time
+
+import slp2mp4.replay as replay
+
+# Frames are printed in batches, to keep sleeps coarse
+_BATCH = 60
+
+
+def _get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exec", required=True)
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--video_backend")
+    parser.add_argument("--slippi-input", type=pathlib.Path, required=True)
+    parser.add_argument("--hide-seekbar", action="store_true")
+    parser.add_argument("--output-directory", type=pathlib.Path, required=True)
+    parser.add_argument("--user", type=pathlib.Path)
+    parser.add_argument("--cout", action="store_true")
+    return parser.parse_args()
+
+
+def _read_comm(comm_file: pathlib.Path):
+    try:
+        with open(comm_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _play(slp_path: pathlib.Path, dump_dir: pathlib.Path, index: int, fps, size):
+    num_frames = replay.read_info(slp_path).num_frames
+    end_frame = replay.FIRST_FRAME + num_frames - 1
+    header = f"{slp_path}\n".encode()
+    with (
+        open(dump_dir / f"framedump{index}.avi", "wb") as video,
+        open(dump_dir / "dspdump.wav", "wb") as audio,
+    ):
+        video.write(header)
+        audio.write(header)
+        print(f"[GAME_END_FRAME] {end_frame}", flush=True)
+        start = time.monotonic()
+        frame_data = bytes(size)
+        for frame in range(replay.FIRST_FRAME, end_frame + 1):
+            video.write(frame_data)
+            print(f"[CURRENT_FRAME] {frame}")
+            played = frame - replay.FIRST_FRAME + 1
+            if played % _BATCH == 0:
+                sys.stdout.flush()
+                if fps > 0:
+                    ahead = played / fps - (time.monotonic() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        sys.stdout.flush()
+
+
+def main():
+    args = _get_args()
+    fps = float(os.environ.get("SLP2MP4_FAKE_FPS", 600))
+    boot = float(os.environ.get("SLP2MP4_FAKE_BOOT", 0.5))
+    size = int(os.environ.get("SLP2MP4_FAKE_DUMP_BYTES", 16))
+    if not pathlib.Path(args.exec).exists():
+        sys.exit(f"ISO not found: {args.exec}")
+    time.sleep(boot)
+    index = 0
+    command_id = None
+    while True:
+        comm = _read_comm(args.slippi_input)
+        if comm is None or comm["commandId"] == command_id:
+            time.sleep(0.02)
+            continue
+        command_id = comm["commandId"]
+        _play(pathlib.Path(comm["replay"]), args.output_directory, index, fps, size)
+        index += 1
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Stand-in for ffmpeg that understands the invocations FfmpegRunner makes
+# Outputs are the inputs' contents joined together (the concat demuxer's list
+# is followed), so each video ends up naming the replays it was made from, in
+# order. Progress is reported when asked for with -progress.
+
+import concurrent.futures
+import pathlib
+import sys
+
+# Options that take a value; everything else is a flag or the output
+_VALUE_OPTIONS = {
+    "-i",
+    "-f",
+    "-c",
+    "-c:v",
+    "-c:a",
+    "-b:v",
+    "-b:a",
+    "-ar",
+    "-ac",
+    "-map",
+    "-filter:a",
+    "-safe",
+    "-progress",
+    "-movflags",
+    "-avoid_negative_ts",
+    "-dts_delta_threshold",
+    "-thread_queue_size",
+}
+
+
+def _parse(args):
+    inputs = []
+    options = {}
+    output = None
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in _VALUE_OPTIONS:
+            if arg == "-i":
+                inputs.append((options.get("-f"), args[i + 1]))
+            options[arg] = args[i + 1]
+            i += 2
+            continue
+        if not arg.startswith("-"):
+            output = arg
+        i += 1
+    return inputs, options, output
+
+
+def _open(path):
+    if path == "pipe:0":
+        return sys.stdin.buffer
+    return open(path, "rb")
+
+
+def _read_concat_list(path):
+    data = b""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("file "):
+                data += pathlib.Path(line[len("file ") :].strip("'")).read_bytes()
+    return data
+
+
+def main():
+    inputs, options, output = _parse(sys.argv[1:])
+    if output is None or not inputs:
+        sys.exit("fake ffmpeg: no inputs or output")
+    if inputs[0][0] == "concat":
+        data = _read_concat_list(inputs[0][1])
+    else:
+        # Like ffmpeg, every input is opened before any is read, and they're
+        # read at the same time, which matters for named pipes
+        files = [_open(path) for _, path in inputs]
+        with concurrent.futures.ThreadPoolExecutor(len(files)) as pool:
+            data = b"".join(pool.map(lambda f: f.read(), files))
+    pathlib.Path(output).write_bytes(data)
+    if options.get("-progress") == "pipe:1":
+        print("frame=0\nout_time_us=0\nprogress=continue", flush=True)
+        print(f"out_time_us={len(data)}\nprogress=end", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Writes synthetic .slp replays: a valid header, event payloads, game start
+# event and metadata, padded with zeroed frame data of the right size
+# https://github.com/project-slippi/slippi-wiki/blob/master/SPEC.md
+
+import argparse
+import pathlib
+import struct
+
+_PAYLOAD_SIZES = {
+    0x36: 0x2FF,  # Game start
+    0x37: 0x3F,  # Pre-frame update
+    0x38: 0x54,  # Post-frame update
+    0x39: 0x1,  # Game end
+    0x3A: 0xC,  # Frame start
+    0x3C: 0x8,  # Frame bookend
+}
+_FIRST_FRAME = -123
+_EMPTY_PLAYER = 3
+
+
+def _ubjson_key(key: str) -> bytes:
+    data = key.encode()
+    return b"U" + bytes([len(data)]) + data
+
+
+def _ubjson_str(value: str) -> bytes:
+    return b"S" + _ubjson_key(value)
+
+
+def _get_event_payloads() -> bytes:
+    entries = b"".join(
+        struct.pack(">BH", command, size) for command, size in _PAYLOAD_SIZES.items()
+    )
+    return bytes([0x35, len(entries) + 1]) + entries
+
+
+def _get_game_start(stage: int, characters) -> bytes:
+    game_start = bytearray(_PAYLOAD_SIZES[0x36] + 1)
+    game_start[0] = 0x36
+    game_start[1:5] = bytes([3, 14, 0, 0])
+    struct.pack_into(">H", game_start, 0x13, stage)
+    for port in range(4):
+        offset = 0x65 + 0x24 * port
+        if port < len(characters):
+            game_start[offset] = characters[port]
+            game_start[offset + 1] = 0
+        else:
+            game_start[offset + 1] = _EMPTY_PLAYER
+    return bytes(game_start)
+
+
+def _get_frame_size(num_players: int) -> int:
+    per_player = _PAYLOAD_SIZES[0x37] + _PAYLOAD_SIZES[0x38] + 2
+    return per_player * num_players + _PAYLOAD_SIZES[0x3A] + _PAYLOAD_SIZES[0x3C] + 2
+
+
+def _get_metadata(last_frame: int) -> bytes:
+    return (
+        b"U\x08metadata{"
+        + _ubjson_key("startAt")
+        + _ubjson_str("2025-01-01T00:00:00Z")
+        + _ubjson_key("lastFrame")
+        + b"l"
+        + struct.pack(">i", last_frame)
+        + _ubjson_key("playedOn")
+        + _ubjson_str("dolphin")
+        + b"}"
+    )
+
+
+def make_replay(num_frames: int, stage=31, characters=(2, 20)) -> bytes:
+    last_frame = _FIRST_FRAME + num_frames - 1
+    raw = _get_event_payloads() + _get_game_start(stage, characters)
+    raw += bytes(_get_frame_size(len(characters)) * num_frames)
+    return (
+        b"{U\x03raw[$U#l"
+        + struct.pack(">i", len(raw))
+        + raw
+        + _get_metadata(last_frame)
+        + b"}"
+    )
+
+
+# Makes `sets` directories of `games` replays each; game lengths vary a little
+# so the scheduler has something to sort
+def make_batch(directory: pathlib.Path, sets: int, games: int, num_frames: int):
+    for set_index in range(sets):
+        set_dir = directory / f"set{set_index:03}"
+        set_dir.mkdir(parents=True, exist_ok=True)
+        for game in range(games):
+            frames = num_frames * (90 + (set_index * 7 + game * 13) % 21) // 100
+            replay = make_replay(max(frames, 1))
+            (set_dir / f"Game_{game + 1}.slp").write_bytes(replay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic .slp replays")
+    parser.add_argument("directory", type=pathlib.Path)
+    parser.add_argument("--sets", type=int, default=4)
+    parser.add_argument("--games", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=3600)
+    args = parser.parse_args()
+    make_batch(args.directory, args.sets, args.games, args.frames)
+
+
+if __name__ == "__main__":
+    main()
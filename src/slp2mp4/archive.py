@@ -0,0 +1,133 @@
+# Replays inside zip archives, extracted only when they're rendered
+# Zip mode builds its outputs from the archives' central directories, with a
+# ZipMember for each replay. A member is extracted just before its game is
+# rendered, into the run's scratch directory, and removed once its set's
+# video is written (or has failed). Anything that only reads replays (frame
+# estimates, the manifest, ...) reads members straight from the archive.
+# Reading an archive's central directory takes time proportional to its size,
+# so members keep their entry from when they were listed, and each process
+# keeps one open ZipFile per archive to read them from.
+
+import contextlib
+import dataclasses
+import hashlib
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import typing
+import zipfile
+
+# (archive, pid) -> ZipFile; the pid keeps forked workers from sharing a file
+# offset with their parent
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def _get_archive(archive: pathlib.Path) -> zipfile.ZipFile:
+    key = (archive, os.getpid())
+    with _archives_lock:
+        zfile = _archives.get(key)
+        if zfile is None:
+            zfile = _archives[key] = zipfile.ZipFile(archive)
+        return zfile
+
+
+# Closes the archives this process opened, e.g. before their temporary copies
+# are removed
+def close_archives():
+    with _archives_lock:
+        for (_, pid), zfile in list(_archives.items()):
+            if pid == os.getpid():
+                zfile.close()
+        _archives.clear()
+
+
+class MemberStat(typing.NamedTuple):
+    st_size: int
+    st_mtime_ns: int
+
+
+# Quacks like the parts of pathlib.Path that readers of replays use
+@dataclasses.dataclass(frozen=True)
+class ZipMember:
+    archive: pathlib.Path
+    member: str
+    # How the archive is shown, e.g. "/replays.zip/day1.zip" for nested zips,
+    # whose archive is a temporary copy
+    origin: str
+    # The member's entry in the central directory, if it was listed already
+    info: zipfile.ZipInfo | None = dataclasses.field(
+        default=None, compare=False, repr=False
+    )
+
+    def __str__(self):
+        return f"{self.origin}/{self.member}"
+
+    @property
+    def path(self) -> pathlib.PurePosixPath:
+        return pathlib.PurePosixPath(str(self))
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def parent(self) -> pathlib.PurePosixPath:
+        return self.path.parent
+
+    def absolute(self):
+        return self
+
+    def _get_info(self) -> zipfile.ZipInfo:
+        if self.info is not None:
+            return self.info
+        try:
+            return _get_archive(self.archive).getinfo(self.member)
+        except KeyError as e:
+            raise FileNotFoundError(f"slp not found: {self}") from e
+
+    def open(self, mode="rb"):
+        return _get_archive(self.archive).open(self._get_info())
+
+    def stat(self) -> MemberStat:
+        info = self._get_info()
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        return MemberStat(info.file_size, int(mtime * 1e9))
+
+    def get_extracted_path(self, extract_dir: pathlib.Path) -> pathlib.Path:
+        key = hashlib.sha256(str(self).encode()).hexdigest()[:16]
+        return extract_dir / key / self.name
+
+    def extract(self, extract_dir: pathlib.Path) -> pathlib.Path:
+        dest = self.get_extracted_path(extract_dir)
+        if dest.exists():
+            return dest  # Retried
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, suffix=".partial")
+        try:
+            with os.fdopen(fd, "wb") as f, self.open() as member:
+                shutil.copyfileobj(member, f)
+            os.replace(tmp, dest)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+        return dest
+
+    def remove(self, extract_dir: pathlib.Path):
+        shutil.rmtree(self.get_extracted_path(extract_dir).parent, ignore_errors=True)
+
+
+# Returns a path on disk for an input, extracting it first if needed
+def get_local_path(slp, run_scratch):
+    if isinstance(slp, ZipMember):
+        return slp.extract(run_scratch.get_dir("replays"))
+    return slp
+
+
+# Removes an input's extracted copy, if it has one
+def release(slp, run_scratch):
+    if isinstance(slp, ZipMember):
+        slp.remove(run_scratch.get_dir("replays"))
@@ -0,0 +1,95 @@
+# Progressively assembles a set's video while its games are still rendering
+# Games are rendered to MPEG-TS segments, which can be appended back to back.
+# Each segment is fed to a long-running ffmpeg as soon as it and all the games
+# before it are rendered, so only the final remux is left once the last game
+# of the set finishes.
+
+import contextlib
+import os
+import queue
+import shutil
+import threading
+
+import slp2mp4.ffmpeg as ffmpeg
+import slp2mp4.metrics as metrics
+import slp2mp4.util as util
+from slp2mp4.output import Output
+
+
+class _Aborted(Exception):
+    pass
+
+
+class SetAssembler:
+    def __init__(self, conf, output: Output, event_queue):
+        self.Ffmpeg = ffmpeg.FfmpegRunner(conf)
+        self.output = output
+        self.event_queue = event_queue
+        self.segments = queue.Queue()
+        self.aborted = threading.Event()
+        # Only the time spent appending and finishing the video, not the time
+        # spent waiting for games
+        self.timings = {}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, slp_path, segment_path):
+        self.segments.put((slp_path, segment_path))
+
+    # Drops the set; no events are reported for it afterwards
+    def abort(self):
+        self.aborted.set()
+        self.segments.put(None)
+
+    def _append(self, proc, segment_path):
+        with metrics.timed(self.timings, "concat"):
+            with open(segment_path, "rb") as segment:
+                shutil.copyfileobj(segment, proc.stdin)
+        os.unlink(segment_path)
+
+    def _assemble(self, proc, ready):
+        order = iter(self.output.inputs)
+        next_slp = next(order)
+        while next_slp is not None:
+            while next_slp not in ready:
+                item = self.segments.get()
+                if item is None:
+                    return False
+                slp_path, segment_path = item
+                ready[slp_path] = segment_path
+            self._append(proc, ready.pop(next_slp))
+            next_slp = next(order, None)
+        with metrics.timed(self.timings, "concat"):
+            proc.stdin.close()
+            self.Ffmpeg.wait(proc)
+        return True
+
+    def _run(self):
+        output_name = self.output.output
+        ready = {}
+        try:
+            # Appended to a temporary file, so a failed set never leaves a
+            # truncated video (or destroys a previous one)
+            with util.replacing(output_name) as tmp_output:
+                proc = self.Ffmpeg.start_concat_stream(tmp_output)
+                try:
+                    if not self._assemble(proc, ready):
+                        raise _Aborted
+                except BaseException:
+                    with contextlib.suppress(OSError):
+                        proc.stdin.close()
+                    proc.kill()
+                    proc.wait()
+                    raise
+        except _Aborted:
+            pass
+        except Exception as e:
+            if not self.aborted.is_set():
+                self.event_queue.put(("concat_failed", output_name, repr(e)))
+        else:
+            if not self.aborted.is_set():
+                self.event_queue.put(("concatenated", output_name, self.timings))
+        finally:
+            for segment_path in ready.values():
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(segment_path)
@@ -1,3 +1,4 @@
+import copy
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
@@ -8,6 +9,7 @@ import multiprocessing
 
 import slp2mp4.config as config
 import slp2mp4.modes as modes
+import slp2mp4.util as util
 import slp2mp4.version as version
 
 import tomli_w
@@ -248,27 +250,32 @@ class ConfigDialog(tk.Toplevel):
     def save_config(self):
         """Save configuration and close dialog"""
         audio_args = self.ffmpeg_args_var.get("1.0", tk.END).replace("\n", "")
-        self.result = {
-            "paths": {
-                "ffmpeg": self.ffmpeg_var.get(),
-                "slippi_playback": self.slippi_var.get(),
-                "ssbm_iso": self.iso_var.get(),
+        # Start from the current config so settings without a widget are kept
+        self.result = copy.deepcopy(self.config)
+        util.update_dict(
+            self.result,
+            {
+                "paths": {
+                    "ffmpeg": self.ffmpeg_var.get(),
+                    "slippi_playback": self.slippi_var.get(),
+                    "ssbm_iso": self.iso_var.get(),
+                },
+                "dolphin": {
+                    "backend": self.backend_var.get(),
+                    "resolution": self.resolution_var.get(),
+                    "bitrate": self.bitrate_var.get(),
+                },
+                "ffmpeg": {
+                    "volume": self.volume_var.get(),
+                    "audio_args": audio_args,
+                },
+                "runtime": {
+                    "parallel": self.parallel_var.get(),
+                    "prepend_directory": self.prepend_var.get(),
+                    "youtubify_names": self.youtubify_var.get(),
+                },
             },
-            "dolphin": {
-                "backend": self.backend_var.get(),
-                "resolution": self.resolution_var.get(),
-                "bitrate": self.bitrate_var.get(),
-            },
-            "ffmpeg": {
-                "volume": self.volume_var.get(),
-                "audio_args": audio_args,
-            },
-            "runtime": {
-                "parallel": self.parallel_var.get(),
-                "prepend_directory": self.prepend_var.get(),
-                "youtubify_names": self.youtubify_var.get(),
-            },
-        }
+        )
         self.destroy()
 
 
@@ -345,6 +352,9 @@ class Slp2Mp4GUI:
         # Queue for thread communication
         self.queue = queue.Queue()
 
+        # Mode being run, if any
+        self.mode = None
+
         # Load configuration
         self.config = self.load_configuration()
 
@@ -431,6 +441,13 @@ class Slp2Mp4GUI:
             options_frame, text="Dry Run (preview only)", variable=self.dry_run_var
         ).pack(anchor="w")
 
+        self.incremental_var = tk.BooleanVar()
+        ttk.Checkbutton(
+            options_frame,
+            text="Incremental (skip up-to-date outputs)",
+            variable=self.incremental_var,
+        ).pack(anchor="w")
+
         # Control buttons frame
         control_frame = ttk.Frame(self.root)
         control_frame.pack(fill="x", padx=10, pady=10)
@@ -454,7 +471,7 @@ class Slp2Mp4GUI:
 
         self.progress_var = tk.DoubleVar()
         self.progress_bar = ttk.Progressbar(
-            progress_frame, variable=self.progress_var, mode="indeterminate"
+            progress_frame, variable=self.progress_var, mode="determinate"
         )
         self.progress_bar.pack(fill="x", pady=5)
 
@@ -552,7 +569,7 @@ class Slp2Mp4GUI:
         # Disable controls
         self.start_button.config(state="disabled")
         self.stop_button.config(state="normal")
-        self.progress_bar.start()
+        self.progress_var.set(0)
 
         # Clear log
         self.log_text.delete(1.0, tk.END)
@@ -565,6 +582,9 @@ class Slp2Mp4GUI:
         # TODO: Implement proper cancellation
         self.log("Stopping conversion...")
         self.stop_button.config(state="disabled")
+        # Watch mode finishes the sets it started, then returns
+        if self.mode is not None:
+            self.mode.stop()
 
     def run_conversion(self):
         """Run the actual conversion process"""
@@ -572,13 +592,19 @@ class Slp2Mp4GUI:
             paths = [pathlib.Path(self.input_var.get())]
             output_directory = pathlib.Path(self.output_var.get())
             dry_run = self.dry_run_var.get()
+            incremental = self.incremental_var.get()
             mode = modes.MODES[self.mode_var.get()].mode(paths, output_directory)
+            self.mode = mode
             self.queue.put(("log", "Starting conversion..."))
-            output = mode.run(dry_run)
-            if output:
+            output = mode.run(dry_run, incremental, self.report_progress)
+            if output and dry_run:
                 self.queue.put(("log", "Dry run results:"))
+            if output:
                 self.queue.put(("log", output.rstrip()))
-            self.queue.put(("log", "\nConversion completed successfully!"))
+            if mode.failures:
+                self.queue.put(("log", "\nConversion completed with failures"))
+            else:
+                self.queue.put(("log", "\nConversion completed successfully!"))
         except Exception as e:
             import traceback
 
@@ -587,6 +613,10 @@ class Slp2Mp4GUI:
         finally:
             self.queue.put(("done", None))
 
+    def report_progress(self, progress):
+        """Called from the conversion thread as the batch progresses"""
+        self.queue.put(("progress", (progress.get_fraction(), progress.get_summary())))
+
     def process_queue(self):
         """Process messages from worker thread"""
         try:
@@ -598,8 +628,11 @@ class Slp2Mp4GUI:
                 elif msg_type == "error":
                     self.log(f"ERROR: {msg_data}")
                     messagebox.showerror("Conversion Error", msg_data)
+                elif msg_type == "progress":
+                    fraction, summary = msg_data
+                    self.progress_var.set(fraction * 100)
+                    self.status_label.config(text=summary)
                 elif msg_type == "done":
-                    self.progress_bar.stop()
                     self.start_button.config(state="normal")
                     self.stop_button.config(state="disabled")
                     self.status_label.config(text="Ready")
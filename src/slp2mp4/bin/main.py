@@ -1,8 +1,12 @@
 import argparse
 import pathlib
+import signal
+import sys
 
 import slp2mp4.modes as modes
+import slp2mp4.progress as progress
 import slp2mp4.version as version
+from slp2mp4.modes.mode import Mode
 
 
 def get_parser():
@@ -20,6 +24,12 @@ def get_parser():
         action="store_true",
         help="show inputs and outputs and exit",
     )
+    parser.add_argument(
+        "-i",
+        "--incremental",
+        action="store_true",
+        help="only convert outputs whose inputs or settings changed",
+    )
     parser.add_argument(
         "-v",
         "--version",
@@ -40,13 +50,29 @@ def get_parser():
     return parser
 
 
+# Modes that run until they're stopped finish what they've started on Ctrl+C;
+# a second Ctrl+C interrupts them like any other mode
+def _stop_on_interrupt(mode):
+    def on_interrupt(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        mode.stop()
+
+    if type(mode).stop is not Mode.stop:
+        signal.signal(signal.SIGINT, on_interrupt)
+
+
 def main():
     parser = get_parser()
     args = parser.parse_args()
     mode = args.run(args.paths, args.output_directory)
-    output = mode.run(args.dry_run)
+    reporter = progress.TerminalReporter()
+    _stop_on_interrupt(mode)
+    output = mode.run(args.dry_run, args.incremental, reporter)
+    reporter.close()
     if output:
         print(output.rstrip())
+    if mode.failures:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+# On-disk cache of rendered games
+# Entries are keyed on the replay contents plus the render settings, so a game
+# is only rendered again when either of them changes. The least recently used
+# entries are evicted once the cache grows past `max_size` (in MB).
+# Entries are copied in and out rather than hardlinked: intermediates end up as
+# output videos, which later runs overwrite in place.
+
+import contextlib
+import os
+import pathlib
+import shutil
+import tempfile
+
+import slp2mp4.config as config
+import slp2mp4.util as util
+
+
+class RenderCache:
+    def __init__(self, conf):
+        self.directory = conf["cache"]["directory"]
+        self.max_size = conf["cache"]["max_size"] * 1024 * 1024
+        self.fingerprint = config.get_render_fingerprint(conf)
+
+    def get_key(self, slp_path: pathlib.Path, suffix=".mp4") -> str:
+        hasher = util.hash_file(slp_path)
+        hasher.update(self.fingerprint.encode())
+        return hasher.hexdigest() + suffix
+
+    def _get_entry(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / key
+
+    # Returns True if the entry was found and copied to `dest`
+    def fetch(self, key: str, dest: pathlib.Path) -> bool:
+        entry = self._get_entry(key)
+        try:
+            # Touch the entry so eviction sees it as recently used
+            os.utime(entry)
+            with contextlib.suppress(FileNotFoundError):
+                dest.unlink()
+            shutil.copyfile(entry, dest)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key: str, src: pathlib.Path):
+        entry = self._get_entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary name first so other workers never see a
+        # partially written entry
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, suffix=".partial")
+        os.close(fd)
+        tmp_path = pathlib.Path(tmp)
+        try:
+            tmp_path.unlink()
+            shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, entry)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                tmp_path.unlink()
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in self.directory.glob("*/*"):
+            if entry.suffix == ".partial":
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                entries.append((entry.stat(), entry))
+        total = sum(stat.st_size for stat, _ in entries)
+        entries.sort(key=lambda e: e[0].st_mtime)
+        for stat, entry in entries:
+            if total <= self.max_size:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                entry.unlink()
+            total -= stat.st_size
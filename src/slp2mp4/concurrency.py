@@ -0,0 +1,90 @@
+# Adapts how many games are rendered at once to what the machine can sustain
+# Dolphin and ffmpeg are both multi-threaded, so one render per core
+# oversubscribes most machines. Starting from a quarter of the cores, the limit
+# is probed upwards one render at a time, and kept there as long as throughput
+# (frames rendered per second across all workers) improves. A step that
+# doesn't help is undone, and the limit is lowered whenever the machine is
+# overloaded or each render slows down. The limit is probed again every few
+# intervals, since the mix of games and other load on the machine change
+# during a batch.
+
+import os
+import time
+
+# Seconds between adjustments; long enough to average over game boundaries
+_INTERVAL = 30
+# Relative throughput change that counts as better / worse
+_TOLERANCE = 0.05
+# 1 minute load average per core above which renders are taken away
+_MAX_LOAD = 1.5
+# Intervals spent at a limit before probing for a higher one
+_PROBE_AFTER = 4
+
+
+def _get_load():
+    try:
+        return os.getloadavg()[0] / os.cpu_count()
+    except (AttributeError, OSError):
+        return None  # Not available on Windows
+
+
+class AdaptiveLimit:
+    def __init__(self, max_workers: int, interval: float = _INTERVAL):
+        self.max_workers = max_workers
+        self.limit = max(1, min(max_workers, os.cpu_count() // 4))
+        self.interval = interval
+        self.probing = True
+        self.intervals_held = 0
+        self.last_check = time.monotonic()
+        self.last_frames = 0
+        self.last_throughput = None
+        self.last_fps = None
+
+    def get_wait_time(self) -> float:
+        return max(0, self.last_check + self.interval - time.monotonic())
+
+    def _is_slower(self, value, last) -> bool:
+        return last is not None and value < last * (1 - _TOLERANCE)
+
+    def _step(self, throughput: float, fps: float):
+        load = _get_load()
+        if load is not None and load > _MAX_LOAD:
+            self.limit = max(self.limit - 1, 1)
+            self.probing = False
+        elif self.probing:
+            last = self.last_throughput
+            if last is None or throughput > last * (1 + _TOLERANCE):
+                self.limit = min(self.limit + 1, self.max_workers)
+            else:
+                # The extra render only slowed the others down
+                self.limit = max(self.limit - 1, 1)
+                self.probing = False
+        elif self._is_slower(throughput, self.last_throughput) and self._is_slower(
+            fps, self.last_fps
+        ):
+            # Each render got slower, rather than e.g. more of them booting
+            self.limit = max(self.limit - 1, 1)
+        else:
+            self.intervals_held += 1
+            if self.intervals_held >= _PROBE_AFTER:
+                self.probing = True
+                self.intervals_held = 0
+                self.limit = min(self.limit + 1, self.max_workers)
+
+    # Takes the frames rendered so far, how many renders are running, and their
+    # mean fps; returns the limit for the next interval
+    def update(self, frames_done: int, running: int, fps: float) -> int:
+        now = time.monotonic()
+        if now - self.last_check < self.interval:
+            return self.limit
+        throughput = (frames_done - self.last_frames) / (now - self.last_check)
+        self.last_check = now
+        self.last_frames = frames_done
+        # Throughput says nothing about the limit when it wasn't reached, e.g.
+        # at the end of a batch
+        if running < self.limit:
+            return self.limit
+        self._step(throughput, fps)
+        self.last_throughput = throughput
+        self.last_fps = fps
+        return self.limit
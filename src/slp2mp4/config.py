@@ -1,9 +1,12 @@
 # Handles configuration options
 
+import hashlib
 import importlib.resources
+import json
 import os
 import pathlib
 import shutil
+import sys
 import tomllib
 import typing
 
@@ -46,6 +49,24 @@ def _parse_path(path_str):
     return (path.exists(), path)
 
 
+def _parse_dir_path(path_str):
+    return (True, pathlib.Path(path_str).expanduser())
+
+
+# Empty strings disable optional outputs
+def _parse_optional_path(path_str):
+    if path_str == "":
+        return (True, None)
+    return _parse_dir_path(path_str)
+
+
+def _parse_optional_dir(path_str):
+    if path_str == "":
+        return (True, None)
+    path = pathlib.Path(path_str).expanduser()
+    return (path.is_dir(), path)
+
+
 def _parse_bin_path(path_str):
     status, path = _parse_path(path_str)
     if status and path.is_absolute():
@@ -67,6 +88,10 @@ def _parse_int(int_str):
     return _parse_to_type(str(int_str), int)
 
 
+def _parse_float(float_str):
+    return _parse_to_type(str(float_str), float)
+
+
 def _parse_bool(bool_str):
     return (isinstance(bool_str, bool), bool_str)
 
@@ -83,6 +108,18 @@ def _parse_resolution(resolution):
     return _parse_from_dict(resolution, RESOLUTIONS)
 
 
+# Named pipes are only supported on Linux
+def _parse_stream_dumps(stream_dumps):
+    status, value = _parse_bool(stream_dumps)
+    return (status and (not value or sys.platform == "linux"), value)
+
+
+# 0 lets the OS pick a free port
+def _parse_port(port):
+    status, value = _parse_int(port)
+    return (status and 0 <= value <= 65535, value)
+
+
 def _parse_parallel(parallel):
     status, count = _parse_int(parallel)
     return (status, os.cpu_count() if count == 0 else count)
@@ -98,6 +135,10 @@ _TRANSFORMERS = {
         "backend": _parse_backend,
         "resolution": _parse_resolution,
         "bitrate": _parse_int,
+        "stream_dumps": _parse_stream_dumps,
+        "persistent": _parse_bool,
+        "stall_timeout": _parse_float,
+        "min_fps": _parse_float,
     },
     "ffmpeg": {
         "audio_args": _parse_str,
@@ -105,9 +146,51 @@ _TRANSFORMERS = {
     },
     "runtime": {
         "parallel": _parse_parallel,
+        "adaptive": _parse_bool,
+        "memory_budget": _parse_int,
+        "max_active_sets": _parse_int,
+        "concat_parallel": _parse_parallel,
+        "progressive_sets": _parse_bool,
+        "retries": _parse_int,
+        "retry_delay": _parse_float,
         "prepend_directory": _parse_bool,
         "youtubify_names": _parse_bool,
+        "scratch_dir": _parse_optional_dir,
+        "ram_dir": _parse_optional_dir,
+        "scratch_limit": _parse_int,
+        "scan_threads": _parse_int,
+    },
+    "watch": {
+        "quiet_time": _parse_float,
+        "poll_interval": _parse_float,
+        "polling": _parse_bool,
+    },
+    "serve": {
+        "host": _parse_str,
+        "port": _parse_port,
+    },
+    "cache": {
+        "enabled": _parse_bool,
+        "directory": _parse_dir_path,
+        "max_size": _parse_int,
     },
+    "report": {
+        "json": _parse_optional_path,
+        "prometheus": _parse_optional_path,
+    },
+}
+
+# Settings that change the contents of a rendered game
+_RENDER_SETTINGS = {
+    "dolphin": [
+        "backend",
+        "resolution",
+        "bitrate",
+    ],
+    "ffmpeg": [
+        "audio_args",
+        "volume",
+    ],
 }
 
 
@@ -148,3 +231,13 @@ def get_config():
 
 def translate_and_validate_config(conf):
     _apply_constructors(conf, _TRANSFORMERS)
+
+
+# Identifies the render settings, so outputs can be reused when they match
+def get_render_fingerprint(conf) -> str:
+    settings = {
+        section: {k: str(conf[section][k]) for k in keys}
+        for section, keys in _RENDER_SETTINGS.items()
+    }
+    data = json.dumps(settings, sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
@@ -0,0 +1,102 @@
+# Finds replays and zips in directory trees
+# Each directory is listed once with os.scandir, whose entries know their type
+# from the listing itself, so telling files from directories takes no extra
+# stat calls (which are slow on network shares). Zips are recognized by their
+# extension; only files with neither a zip nor a replay extension are opened to
+# check for the zip signature. Subdirectories can be listed by several threads,
+# since listing is mostly spent waiting on the filesystem.
+
+import concurrent.futures
+import dataclasses
+import os
+import pathlib
+
+import slp2mp4.util as util
+
+# Local file header, or the end of central directory of an empty zip
+_ZIP_SIGNATURES = (b"PK\x03\x04", b"PK\x05\x06")
+
+
+@dataclasses.dataclass
+class Found:
+    location: pathlib.Path
+    slps: list[pathlib.Path]
+    zips: list[pathlib.Path]
+
+
+def is_replay(name: str) -> bool:
+    return name.lower().endswith(".slp")
+
+
+# Only reads the start of the file if the name doesn't say
+def is_zip(name: str, open_file) -> bool:
+    if name.lower().endswith(".zip"):
+        return True
+    if is_replay(name):
+        return False
+    try:
+        with open_file() as f:
+            return f.read(4) in _ZIP_SIGNATURES
+    except OSError:
+        return False
+
+
+# Returns what's in the directory, and its subdirectories as (location, path)
+def scan(path: pathlib.Path, location: pathlib.Path, find_zips: bool):
+    found = Found(location, [], [])
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    subdirs.append((location / entry.name, pathlib.Path(entry.path)))
+                elif not entry.is_file():
+                    continue
+                elif is_replay(entry.name):
+                    found.slps.append(pathlib.Path(entry.path))
+                elif find_zips and is_zip(entry.name, lambda: open(entry.path, "rb")):
+                    found.zips.append(pathlib.Path(entry.path))
+            except OSError:
+                continue  # Removed while scanning
+    found.slps.sort(key=util.natsort)
+    found.zips.sort(key=util.natsort)
+    return found, subdirs
+
+
+def _walk_threaded(path, location, find_zips, threads):
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        pending = {pool.submit(scan, path, location, find_zips)}
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                found, subdirs = future.result()
+                results.append(found)
+                pending.update(
+                    pool.submit(scan, subdir, sublocation, find_zips)
+                    for sublocation, subdir in subdirs
+                )
+    return results
+
+
+# Returns every directory under `path` (including itself), with `location`
+# standing in for `path` in their locations, sorted by location
+def walk(
+    path: pathlib.Path,
+    location: pathlib.Path,
+    find_zips: bool = False,
+    threads: int = 1,
+) -> list[Found]:
+    if threads > 1:
+        results = _walk_threaded(path, location, find_zips, threads)
+    else:
+        results = []
+        pending = [(location, path)]
+        while pending:
+            sublocation, subdir = pending.pop()
+            found, subdirs = scan(subdir, sublocation, find_zips)
+            results.append(found)
+            pending.extend(subdirs)
+    return sorted(results, key=lambda found: util.natsort(found.location))
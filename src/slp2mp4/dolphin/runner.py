@@ -1,18 +1,220 @@
 # Wrapper for running dolphin
 
+import contextlib
+import os
+import queue
+import signal
 import tempfile
 import time
 import pathlib
+import shutil
 import subprocess
+import sys
+import threading
+from stat import S_ISFIFO, S_ISREG
 
 import slp2mp4.replay as replay
 import slp2mp4.dolphin.comm as comm
 import slp2mp4.dolphin.ini as ini
 import slp2mp4.util as util
 
+AUDIO_DUMP_NAME = "dspdump.wav"
+VIDEO_DUMP_NAME = "framedump0.avi"
+
+# Dumps count as finished once they haven't grown for _DUMP_SETTLE_TIME
+_DUMP_POLL_INTERVAL = 0.1
+_DUMP_SETTLE_TIME = 0.3
+_DUMP_TIMEOUT = 2
+
+# Time allowed for booting dolphin on top of a replay's frame budget
+_STARTUP_BUDGET = 60
+
+# Maximum unprivileged pipe size on Linux by default
+_PIPE_SIZE = 1024 * 1024
+
+
+class DolphinError(RuntimeError):
+    pass
+
+
+# Dolphin numbers its dumps, starting over from 0 when it's restarted
+def _find_dump(dump_dir: pathlib.Path, pattern: str):
+    dumps = sorted(dump_dir.glob(pattern), key=lambda path: (len(path.name), path))
+    return dumps[0] if dumps else None
+
+
+# Bytes written to a named pipe that haven't been read yet
+def _get_unread_size(path: pathlib.Path) -> int:
+    import fcntl
+    import termios
+
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        unread = fcntl.ioctl(fd, termios.FIONREAD, b"\0" * 4)
+    finally:
+        os.close(fd)
+    return int.from_bytes(unread, sys.byteorder)
+
+
+# Named pipes (see DumpFifos) only count once they're drained, since there's
+# no size to watch
+def _get_dump_size(path: pathlib.Path):
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    if S_ISFIFO(stat.st_mode):
+        return 0 if _get_unread_size(path) == 0 else None
+    return stat.st_size if S_ISREG(stat.st_mode) else None
+
+
+# Dolphin is done with its dumps once their sizes stop changing; returns False
+# if that didn't happen within the timeout
+def _wait_for_dumps(paths, timeout: float = _DUMP_TIMEOUT) -> bool:
+    start = time.monotonic()
+    sizes = None
+    settled_since = start
+    while (now := time.monotonic()) - start < timeout:
+        current = [_get_dump_size(path) for path in paths]
+        if current != sizes or None in current:
+            sizes = current
+            settled_since = now
+        elif now - settled_since >= _DUMP_SETTLE_TIME:
+            return True
+        time.sleep(_DUMP_POLL_INTERVAL)
+    return False
+
+
+class DolphinTimeout(DolphinError):
+    pass
+
+
+# Runs dolphin in its own process group / tree, so it can be killed along with
+# anything it starts. Output is read in the background, so it can be waited on
+# with a timeout
+class _DolphinProcess:
+    def __init__(self, args):
+        kwargs = {}
+        if sys.platform != "win32":
+            kwargs["start_new_session"] = True
+        self.popen = subprocess.Popen(
+            args=args, stdout=subprocess.PIPE, text=True, **kwargs
+        )
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        for line in self.popen.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    # Returns the next line, None once dolphin exits, or raises queue.Empty
+    def readline(self, timeout: float | None):
+        return self.lines.get(timeout=timeout)
+
+    def is_running(self) -> bool:
+        return self.popen.poll() is None
+
+    def kill(self):
+        if sys.platform == "win32":
+            subprocess.run(
+                ["taskkill", "/T", "/F", "/PID", str(self.popen.pid)],
+                capture_output=True,
+            )
+        else:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(self.popen.pid, signal.SIGKILL)
+        with contextlib.suppress(ProcessLookupError):
+            self.popen.kill()
+        self.popen.wait()
+
+    def stop(self):
+        self.popen.terminate()
+        try:
+            self.popen.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+
+# Gives up on renders that stop making progress, or that take far longer than
+# the replay's length suggests. Booting dolphin counts as a stall
+class _Watchdog:
+    def __init__(self, stall_timeout: float, min_fps: float, num_frames: int):
+        self.stall_timeout = stall_timeout
+        self.last_progress = time.monotonic()
+        self.deadline = None
+        if min_fps > 0 and num_frames > 0:
+            self.budget = _STARTUP_BUDGET + num_frames / min_fps
+            self.deadline = self.last_progress + self.budget
+
+    def on_progress(self):
+        self.last_progress = time.monotonic()
+
+    def _get_deadlines(self):
+        if self.stall_timeout > 0:
+            yield self.last_progress + self.stall_timeout
+        if self.deadline is not None:
+            yield self.deadline
+
+    # Seconds until the next check is due, or None if there is nothing to check
+    def get_wait_time(self):
+        deadline = min(self._get_deadlines(), default=None)
+        if deadline is None:
+            return None
+        return max(0, deadline - time.monotonic())
+
+    def check(self):
+        now = time.monotonic()
+        if self.stall_timeout > 0 and now - self.last_progress >= self.stall_timeout:
+            raise DolphinTimeout(
+                f"Dolphin made no progress for {self.stall_timeout:g} seconds"
+            )
+        if self.deadline is not None and now >= self.deadline:
+            raise DolphinTimeout(
+                f"Dolphin did not finish the replay within {self.budget:.0f} seconds"
+            )
+
+
+# Linux only: makes the dump paths named pipes, so the dumps can be read while
+# dolphin is still writing them and never touch the disk
+class DumpFifos:
+    def __init__(self, dump_dir: pathlib.Path):
+        self.dump_dir = dump_dir
+        self.audio_file = dump_dir.joinpath(AUDIO_DUMP_NAME)
+        self.video_file = dump_dir.joinpath(VIDEO_DUMP_NAME)
+        self.fds = []
+
+    def __enter__(self):
+        import fcntl
+
+        for path in (self.audio_file, self.video_file):
+            os.mkfifo(path)
+            # Holding both ends keeps opening the pipe from blocking, no matter
+            # which order dolphin and ffmpeg open them in
+            fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+            self.fds.append(fd)
+            with contextlib.suppress(OSError):
+                fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, _PIPE_SIZE)
+        # Dolphin deletes existing dump files before dumping, which would
+        # replace the pipes with regular files
+        self.dump_dir.chmod(0o555)
+        return self
+
+    # Readers only see the end of the dumps once this is called
+    def release(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds.clear()
+
+    def __exit__(self, *exc):
+        self.release()
+        self.dump_dir.chmod(0o755)
+
 
 class DolphinRunner:
-    def __init__(self, config):
+    def __init__(self, config, run_scratch):
+        self.run_scratch = run_scratch
         self.slippi_playback = config["paths"]["slippi_playback"]
         self.ssbm_iso = config["paths"]["ssbm_iso"]
         self.video_backend = config["dolphin"]["backend"]
@@ -22,6 +224,12 @@ class DolphinRunner:
                 "BitrateKbps": str(config["dolphin"]["bitrate"]),
             },
         }
+        self.stall_timeout = config["dolphin"]["stall_timeout"]
+        self.min_fps = config["dolphin"]["min_fps"]
+        # Streamed dumps need a fresh dump directory per game
+        self.persistent = (
+            config["dolphin"]["persistent"] and not config["dolphin"]["stream_dumps"]
+        )
         # https://github.com/project-slippi/Ishiiruka/blob/3e5b185ae080e8dca5e939369572d94d20049fea/Data/Sys/GameSettings/GAL.ini#L21
         # Need to override this setting for non-integral scaling
         self.user_gal = {
@@ -30,80 +238,179 @@ class DolphinRunner:
             },
         }
 
-    def run_dolphin(self, replay: replay.ReplayFile, dump_dir: pathlib.Path):
-        with tempfile.TemporaryDirectory() as userdir_str:
-            userdir = pathlib.Path(userdir_str)
-            with (
-                comm.make_temp_file(replay) as comm_file,
-                ini.make_dolphin_file(userdir) as dolphin_file,
-                ini.make_gfx_file(userdir, self.user_gfx) as gfx_file,
-                ini.make_gal_file(userdir, self.user_gal) as gal_file,
-                ini.make_hotkeys_file(userdir) as hotkeys_file,
-                ini.make_gecko_file(userdir) as gecko_file,
+    # The user directory doesn't change between games, so it's only made once
+    # per runner; only the comm file is rewritten for each replay
+    # Both are small, so they go in the RAM directory, if there is one
+    def __enter__(self):
+        self.exit_stack = contextlib.ExitStack()
+        userdir_str = self.exit_stack.enter_context(
+            tempfile.TemporaryDirectory(
+                dir=self.run_scratch.get_dir("dolphin", ram=True)
+            )
+        )
+        self.userdir = pathlib.Path(userdir_str)
+        self.exit_stack.enter_context(ini.make_dolphin_file(self.userdir))
+        self.exit_stack.enter_context(ini.make_gfx_file(self.userdir, self.user_gfx))
+        self.exit_stack.enter_context(ini.make_gal_file(self.userdir, self.user_gal))
+        self.exit_stack.enter_context(ini.make_hotkeys_file(self.userdir))
+        self.exit_stack.enter_context(ini.make_gecko_file(self.userdir))
+        self.comm_file = self.userdir / "comm.json"
+        # Dumps are too big for the RAM directory
+        self.persistent_dump_dir = self.run_scratch.make_dir("dumps")
+        self.exit_stack.callback(
+            shutil.rmtree, self.persistent_dump_dir, ignore_errors=True
+        )
+        self.proc = None
+        return self
+
+    def __exit__(self, *exc):
+        if self.proc is not None:
+            self.proc.stop()
+            self.proc = None
+        self.exit_stack.close()
+
+    def _get_args(self, dump_dir: pathlib.Path):
+        args = (
+            (self.slippi_playback,),
+            (
+                "--exec",
+                self.ssbm_iso,
+            ),
+            ("--batch",),
+            (
+                "--video_backend",
+                self.video_backend,
+            ),
+            (
+                "--slippi-input",
+                self.comm_file,
+            ),
+            ("--hide-seekbar",),
+            (
+                "--output-directory",
+                dump_dir,
+            ),
+            (
+                "--user",
+                self.userdir,
+            ),
+            ("--cout",),
+        )
+        return util.flatten_arg_tuples(args)
+
+    def _launch(self, dump_dir: pathlib.Path):
+        return _DolphinProcess(self._get_args(dump_dir))
+
+    # Reads dolphin's output until the replay's last frame has been dumped
+    # Frames are only counted once the replay's end frame is known, so output
+    # left over from a previous replay is skipped
+    def _wait_for_game_end(
+        self, proc: _DolphinProcess, num_frames: int, on_progress=None
+    ):
+        watchdog = _Watchdog(self.stall_timeout, self.min_fps, num_frames)
+        game_end_frame = None
+        current_frame = replay.FIRST_FRAME - 1
+
+        while True:
+            try:
+                line = proc.readline(watchdog.get_wait_time())
+            except queue.Empty:
+                watchdog.check()
+                continue
+            if line is None:
+                break
+            strip_line = line.rstrip()
+
+            if strip_line.startswith("[GAME_END_FRAME] "):
+                game_end_frame = int(strip_line.removeprefix("[GAME_END_FRAME] "))
+                current_frame = replay.FIRST_FRAME - 1
+            # Frames from before the replay's end frame are a previous replay's
+            elif game_end_frame is not None and strip_line.startswith(
+                "[CURRENT_FRAME] "
             ):
-                args = (
-                    (self.slippi_playback,),
-                    (
-                        "--exec",
-                        self.ssbm_iso,
-                    ),
-                    ("--batch",),
-                    (
-                        "--video_backend",
-                        self.video_backend,
-                    ),
-                    (
-                        "--slippi-input",
-                        comm_file,
-                    ),
-                    ("--hide-seekbar",),
-                    (
-                        "--output-directory",
-                        dump_dir,
-                    ),
-                    (
-                        "--user",
-                        userdir,
-                    ),
-                    ("--cout",),
-                )
-                dolphin_args = util.flatten_arg_tuples(args)
-                try:
-                    proc = subprocess.Popen(
-                        args=dolphin_args, stdout=subprocess.PIPE, text=True
+                frame = int(strip_line.removeprefix("[CURRENT_FRAME] "))
+                if frame > current_frame:
+                    watchdog.on_progress()
+                current_frame = frame
+                if on_progress is not None:
+                    on_progress(
+                        max(current_frame - replay.FIRST_FRAME + 1, 0),
+                        game_end_frame - replay.FIRST_FRAME + 1,
                     )
-                    game_end_frame = -124
-                    current_frame = -125
-
-                    while proc.poll() is None:
-                        line = proc.stdout.readline()
-                        if not line:
-                            break
-                        strip_line = line.rstrip()
-
-                        if strip_line.startswith("[GAME_END_FRAME] "):
-                            game_end_frame = int(
-                                strip_line.removeprefix("[GAME_END_FRAME] ")
-                            )
-                        elif strip_line.startswith("[CURRENT_FRAME] "):
-                            current_frame = int(
-                                strip_line.removeprefix("[CURRENT_FRAME] ")
-                            )
-
-                        if current_frame >= game_end_frame:
-                            break
-
-                    # Kills dolphin (if need be) when finished dumping
-                    if current_frame != game_end_frame:
-                        print("Dolphin terminated early")
-                    time.sleep(2)
-                    proc.terminate()
-                    proc.wait(timeout=5)
-
-                except subprocess.CalledProcessError as e:
-                    print(f"Dolphin failed with error ${e}")
-                    raise
-
-        audio_file = dump_dir.joinpath("dspdump.wav")
-        video_file = dump_dir.joinpath("framedump0.avi")
+
+            if game_end_frame is not None and current_frame >= game_end_frame:
+                return
+            watchdog.check()
+
+        raise DolphinError(
+            f"Dolphin exited at frame {current_frame} of {game_end_frame}"
+        )
+
+    # Raises DolphinTimeout if the watchdog gave up on dolphin
+    # on_progress is called with (frames done, frames total) as frames are dumped
+    def run_dolphin(
+        self,
+        replay_file: replay.ReplayFile,
+        dump_dir: pathlib.Path,
+        on_progress=None,
+    ):
+        comm.write_file(self.comm_file, replay_file)
+        num_frames = replay_file.get_num_frames()
+        if self.persistent:
+            return self._run_persistent(dump_dir, num_frames, on_progress)
+
+        proc = self._launch(dump_dir)
+        try:
+            self._wait_for_game_end(proc, num_frames, on_progress)
+        except:
+            proc.kill()
+            raise
+
+        audio_file = dump_dir.joinpath(AUDIO_DUMP_NAME)
+        video_file = dump_dir.joinpath(VIDEO_DUMP_NAME)
+        # Kills dolphin when finished dumping
+        _wait_for_dumps((audio_file, video_file))
+        proc.stop()
         return audio_file, video_file
+
+    # The running dolphin picks up the new comm file and starts a fresh set of
+    # dumps; they're moved out of its dump directory once they stop growing
+    def _run_persistent(self, dump_dir: pathlib.Path, num_frames: int, on_progress):
+        if self.proc is None or not self.proc.is_running():
+            self.proc = self._launch(self.persistent_dump_dir)
+        try:
+            self._wait_for_game_end(self.proc, num_frames, on_progress)
+        except:
+            self.proc.kill()
+            self.proc = None
+            raise
+
+        audio_file = _find_dump(self.persistent_dump_dir, "dspdump*.wav")
+        video_file = _find_dump(self.persistent_dump_dir, "framedump*.avi")
+        settled = (
+            audio_file is not None
+            and video_file is not None
+            and _wait_for_dumps((audio_file, video_file))
+        )
+        if not settled:
+            # This dolphin doesn't split its dumps per replay, so fall back to
+            # one dolphin per game
+            print("Dolphin did not start new dumps for the replay - restarting it")
+            self.persistent = False
+            self.proc.stop()
+            self.proc = None
+            if audio_file is None or video_file is None:
+                self._clear_dumps()
+                raise DolphinError("Dolphin did not dump the replay")
+
+        shutil.move(audio_file, dump_dir.joinpath(AUDIO_DUMP_NAME))
+        shutil.move(video_file, dump_dir.joinpath(VIDEO_DUMP_NAME))
+        self._clear_dumps()
+        return dump_dir.joinpath(AUDIO_DUMP_NAME), dump_dir.joinpath(VIDEO_DUMP_NAME)
+
+    # Anything else dolphin dumped (e.g. a second video file after a
+    # resolution change) isn't used
+    def _clear_dumps(self):
+        for path in self.persistent_dump_dir.iterdir():
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
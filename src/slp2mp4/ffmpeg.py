@@ -8,6 +8,21 @@ import shlex
 import slp2mp4.util as util
 
 
+# `audio_args` may force a format for standalone audio files (e.g. `-f opus`),
+# which would override the container of the merged output
+def _drop_format_args(args):
+    dropped = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg == "-f":
+            skip = True
+        else:
+            dropped.append(arg)
+    return dropped
+
+
 class FfmpegRunner:
     def __init__(self, config):
         self.conf = config
@@ -16,47 +31,60 @@ class FfmpegRunner:
 
     def _run(self, args):
         ffmpeg_args = [self.ffmpeg_path] + util.flatten_arg_tuples(args)
-        subprocess.run(ffmpeg_args, check=True)
+        subprocess.run(ffmpeg_args, check=True, **util.get_session_kwargs())
 
-    def reencode_audio(self, audio_file_path: pathlib.Path):
-        reencoded_path = audio_file_path.parent / "fixed.out"
-        args = (
-            ("-y",),
-            (
-                "-i",
-                audio_file_path,
-            ),
-            self.audio_args,
-            (
-                "-filter:a",
-                f"volume='{self.conf['ffmpeg']['volume']/100}'",
-            ),
-            (reencoded_path,),
-        )
-        self._run(args)
-        return reencoded_path
+    def _start(self, args, **kwargs):
+        ffmpeg_args = [self.ffmpeg_path] + util.flatten_arg_tuples(args)
+        return subprocess.Popen(ffmpeg_args, **util.get_session_kwargs(), **kwargs)
+
+    # on_progress is called with the seconds of output written so far
+    def _run_with_progress(self, args, on_progress):
+        args = (("-progress", "pipe:1", "-nostats"),) + args
+        proc = self._start(args, stdout=subprocess.PIPE, text=True)
+        for line in proc.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "out_time_us" and value.isdigit():
+                on_progress(int(value) / 1_000_000)
+        self.wait(proc)
 
+    def wait(self, proc: subprocess.Popen):
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+    # Reencodes the audio and muxes it with the video in a single pass
     # Assumes output file can handle no reencoding for concat
-    # Returns True if ffmpeg ran successfully, False otherwise
-    def merge_audio_and_video(
+    def _get_merge_args(
         self,
         audio_file: pathlib.Path,
         video_file: pathlib.Path,
         output_file: pathlib.Path,
+        audio_input_args=(),
+        video_input_args=(),
     ):
-        args = (
+        return (
             ("-y",),
+            audio_input_args,
             (
                 "-i",
                 audio_file,
             ),
+            video_input_args,
             (
                 "-i",
                 video_file,
             ),
             (
-                "-c:a",
-                "copy",
+                "-map",
+                "0:a:0",
+            ),
+            (
+                "-map",
+                "1:v:0",
+            ),
+            _drop_format_args(self.audio_args),
+            (
+                "-filter:a",
+                f"volume='{self.conf['ffmpeg']['volume']/100}'",
             ),
             (
                 "-c:v",
@@ -73,7 +101,36 @@ class FfmpegRunner:
             ("-xerror",),
             (output_file,),
         )
-        self._run(args)
+
+    def merge_audio_and_video(
+        self,
+        audio_file: pathlib.Path,
+        video_file: pathlib.Path,
+        output_file: pathlib.Path,
+        on_progress=None,
+    ):
+        args = self._get_merge_args(audio_file, video_file, output_file)
+        if on_progress is None:
+            self._run(args)
+        else:
+            self._run_with_progress(args, on_progress)
+
+    # Merges dumps that are still being written (e.g. named pipes); the formats
+    # are given up front instead of being probed from the pipes
+    def start_merge_audio_and_video(
+        self,
+        audio_file: pathlib.Path,
+        video_file: pathlib.Path,
+        output_file: pathlib.Path,
+    ) -> subprocess.Popen:
+        args = self._get_merge_args(
+            audio_file,
+            video_file,
+            output_file,
+            ("-thread_queue_size", "4096", "-f", "wav"),
+            ("-thread_queue_size", "4096", "-f", "avi"),
+        )
+        return self._start(args)
 
     # Assumes all videos have the same encoding
     def concat_videos(self, videos: [pathlib.Path], output_file: pathlib.Path):
@@ -105,3 +162,33 @@ class FfmpegRunner:
                     (output_file,),
                 )
                 self._run(args)
+
+    # Remuxes MPEG-TS segments written to stdin into output_file as they arrive
+    # Each segment's timestamps start over, so any backwards jump is treated as
+    # a discontinuity
+    def start_concat_stream(self, output_file: pathlib.Path) -> subprocess.Popen:
+        args = (
+            ("-y",),
+            (
+                "-dts_delta_threshold",
+                "1",
+            ),
+            (
+                "-f",
+                "mpegts",
+            ),
+            (
+                "-i",
+                "pipe:0",
+            ),
+            (
+                "-c",
+                "copy",
+            ),
+            (
+                "-movflags",
+                "+faststart",
+            ),
+            (output_file,),
+        )
+        return self._start(args, stdin=subprocess.PIPE)
@@ -0,0 +1,105 @@
+# Tracks which outputs are up to date, for incremental runs
+# The manifest lives next to the outputs and records, for every output, the
+# render settings and the size / mtime / hash of each input. Inputs whose size
+# and mtime are unchanged are trusted without rehashing them.
+
+import json
+import os
+import pathlib
+
+import slp2mp4.util as util
+from slp2mp4.output import Output
+
+MANIFEST_NAME = ".slp2mp4-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _stat_input(path: pathlib.Path) -> dict:
+    stat = path.stat()
+    return {
+        "path": str(path.absolute()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+class Manifest:
+    def __init__(self, output_directory: pathlib.Path, fingerprint: str):
+        self.path = output_directory / MANIFEST_NAME
+        self.fingerprint = fingerprint
+        self.outputs = {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.outputs = data["outputs"]
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, KeyError):
+            print(f"Invalid manifest {self.path} - ignoring")
+
+    # Returns the input records if all inputs match `records`, None otherwise
+    def _check_inputs(self, inputs, records):
+        if len(inputs) != len(records):
+            return None
+        checked = []
+        for path, record in zip(inputs, records):
+            try:
+                current = _stat_input(path)
+            except FileNotFoundError:
+                return None
+            if current["path"] != record["path"]:
+                return None
+            if current["size"] != record["size"]:
+                return None
+            if current["mtime_ns"] != record["mtime_ns"]:
+                # Only touched; fall back to comparing contents
+                current["sha256"] = util.hash_file(path).hexdigest()
+                if current["sha256"] != record["sha256"]:
+                    return None
+            else:
+                current["sha256"] = record["sha256"]
+            checked.append(current)
+        return checked
+
+    def is_up_to_date(self, output: Output) -> bool:
+        entry = self.outputs.get(str(output.output))
+        if entry is None or entry["fingerprint"] != self.fingerprint:
+            return False
+        if not output.output.exists():
+            return False
+        records = self._check_inputs(output.inputs, entry["inputs"])
+        if records is None:
+            return False
+        entry["inputs"] = records
+        return True
+
+    # Records the inputs as they are now, to be passed to update once the
+    # output is written, so inputs that change while it's being written aren't
+    # recorded as up to date
+    def get_records(self, output: Output) -> list:
+        entry = self.outputs.get(str(output.output), {"inputs": []})
+        records = self._check_inputs(output.inputs, entry["inputs"])
+        if records is None:
+            records = []
+            for path in output.inputs:
+                record = _stat_input(path)
+                record["sha256"] = util.hash_file(path).hexdigest()
+                records.append(record)
+        return records
+
+    def update(self, output: Output, records: list):
+        self.outputs[str(output.output)] = {
+            "fingerprint": self.fingerprint,
+            "inputs": records,
+        }
+
+    def save(self):
+        data = {
+            "version": MANIFEST_VERSION,
+            "outputs": self.outputs,
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, self.path)
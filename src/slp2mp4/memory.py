@@ -0,0 +1,123 @@
+# Keeps renders within a memory budget
+# Every render reserves the memory one render is expected to need at its peak:
+# an estimate based on the resolution until a game has been rendered, then a
+# high percentile of the usage measured for single renders recently. On Linux,
+# each rendering worker's dolphin / ffmpeg processes are measured on their own,
+# so concatenation and idle persistent dolphins don't count towards a render,
+# and renders that grow past their reservation hold back new ones. Another
+# render is only started once its reservation fits in the budget; one render
+# is always allowed, so the batch can't get stuck.
+
+import collections
+import os
+import pathlib
+import time
+
+import slp2mp4.config as config
+
+# Dolphin plus ffmpeg at each resolution, on the high side
+_ESTIMATES_MB = {
+    "480p": 700,
+    "720p": 900,
+    "1080p": 1300,
+    "1440p": 1700,
+    "2160p": 2600,
+}
+_MB = 1024 * 1024
+_SAMPLE_INTERVAL = 1
+# Measurements of single renders the reservation is based on; at one sample
+# per render per second, a few minutes' worth
+_WINDOW = 512
+_PERCENTILE = 0.95
+
+
+def _read_stat(pid: str):
+    with open(f"/proc/{pid}/stat", "rb") as f:
+        stat = f.read()
+    # The process name may contain spaces, so fields are counted from its end
+    fields = stat[stat.rindex(b")") + 2 :].split()
+    ppid = int(fields[1])
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return ppid, rss
+
+
+# Memory used by the processes that each of `pids` started, or None where
+# /proc isn't available
+def get_descendants_rss(pids) -> dict | None:
+    proc = pathlib.Path("/proc")
+    if not proc.is_dir():
+        return None
+    children = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            ppid, rss = _read_stat(entry.name)
+        except (OSError, ValueError, IndexError):
+            continue  # Exited while scanning
+        children.setdefault(ppid, []).append((int(entry.name), rss))
+    usages = {}
+    for pid in pids:
+        total = 0
+        pending = [pid]
+        while pending:
+            for child, rss in children.get(pending.pop(), []):
+                total += rss
+                pending.append(child)
+        usages[pid] = total
+    return usages
+
+
+def get_render_estimate(conf) -> int:
+    names = {scale: name for name, scale in config.RESOLUTIONS.items()}
+    return _ESTIMATES_MB[names[conf["dolphin"]["resolution"]]] * _MB
+
+
+class MemoryBudget:
+    def __init__(self, budget_mb: int, estimate: int):
+        self.budget = budget_mb * _MB
+        self.estimate = estimate
+        self.samples = collections.deque(maxlen=_WINDOW)
+        self.measured = False
+        self.usage = 0
+        self.last_sample = 0
+
+    # Updates the measured usage of the workers rendering games (`pids`), at
+    # most every _SAMPLE_INTERVAL seconds
+    def sample(self, pids):
+        now = time.monotonic()
+        if now - self.last_sample < _SAMPLE_INTERVAL:
+            return
+        self.last_sample = now
+        usages = get_descendants_rss(pids)
+        if usages is None:
+            return
+        self.usage = sum(usages.values())
+        # Workers between dolphin and ffmpeg briefly have nothing running
+        self.samples.extend(usage for usage in usages.values() if usage > 0)
+
+    def get_peak_per_render(self) -> float:
+        if not self.samples:
+            return 0
+        samples = sorted(self.samples)
+        return samples[int(_PERCENTILE * (len(samples) - 1))]
+
+    # A render's usage only counts once one has run to the end
+    def on_rendered(self):
+        if self.samples:
+            self.measured = True
+
+    def get_reservation(self) -> float:
+        return self.get_peak_per_render() if self.measured else self.estimate
+
+    def can_start(self, running: int, pids) -> bool:
+        if running == 0:
+            return True
+        self.sample(pids)
+        reservation = self.get_reservation()
+        in_use = max(running * reservation, self.usage)
+        return in_use + reservation <= self.budget
+
+    # Seconds until the usage is worth measuring again
+    def get_wait_time(self) -> float:
+        return max(0, self.last_sample + _SAMPLE_INTERVAL - time.monotonic())
@@ -0,0 +1,198 @@
+# Per-stage timings of a run, written out as a JSON report and optionally as a
+# Prometheus textfile (e.g. for node_exporter's textfile collector)
+# Workers time their own stages, including how long each job waited in its
+# queue, and send the timings along with their results. Game stages are
+# queue_wait, cache, dolphin, ffmpeg (or stream, when the two overlap) and
+# total; set stages are queue_wait and concat.
+
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import time
+
+
+@contextlib.contextmanager
+def timed(timings: dict, stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0) + time.perf_counter() - start
+
+
+# `queued_at` is a time.time() from the process that queued the job
+def get_queue_wait(queued_at: float) -> float:
+    return max(time.time() - queued_at, 0)
+
+
+def _summarize_stages(entries) -> dict:
+    stages = {}
+    for entry in entries:
+        for stage, seconds in entry["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        stage: {
+            "count": len(seconds),
+            "total": sum(seconds),
+            "mean": sum(seconds) / len(seconds),
+            "max": max(seconds),
+        }
+        for stage, seconds in stages.items()
+    }
+
+
+class RunReport:
+    def __init__(self, costs: dict):
+        self.costs = costs
+        self.start = time.time()
+        self.games = []
+        self.failed_games = []
+        self.sets = []
+        # (seconds into the run, limit) for each change of the worker limit
+        self.worker_limits = []
+
+    def on_worker_limit(self, limit: int):
+        self.worker_limits.append((time.time() - self.start, limit))
+
+    def _get_game(self, output_name, slp_path, timings) -> dict:
+        return {
+            "output": str(output_name),
+            "slp": str(slp_path),
+            "frames": self.costs.get(slp_path, 0),
+            "timings": timings,
+        }
+
+    def on_rendered(self, output_name, slp_path, timings: dict, scratch_bytes: int):
+        game = self._get_game(output_name, slp_path, timings)
+        game["scratch_bytes"] = scratch_bytes
+        self.games.append(game)
+
+    def on_failed(self, output_name, slp_path, timings: dict):
+        self.failed_games.append(self._get_game(output_name, slp_path, timings))
+
+    def on_concatenated(self, output_name, timings: dict):
+        self.sets.append({"output": str(output_name), "timings": timings})
+
+    def finish(self, failures) -> dict:
+        end = time.time()
+        duration = max(end - self.start, 1e-9)
+        frames = sum(game["frames"] for game in self.games)
+        # Cache hits are never played
+        played = [
+            game
+            for game in self.games
+            if "dolphin" in game["timings"] or "stream" in game["timings"]
+        ]
+        dolphin_frames = sum(game["frames"] for game in played)
+        dolphin_time = sum(
+            game["timings"].get("dolphin", game["timings"].get("stream", 0))
+            for game in played
+        )
+        return {
+            "started_at": datetime.datetime.fromtimestamp(self.start).isoformat(),
+            "finished_at": datetime.datetime.fromtimestamp(end).isoformat(),
+            "duration": duration,
+            "games_rendered": len(self.games),
+            "failed_attempts": len(self.failed_games),
+            "sets_written": len(self.sets),
+            "sets_failed": len({failure.output for failure in failures}),
+            "frames": frames,
+            "frames_per_second": frames / duration,
+            "games_per_hour": len(self.games) * 3600 / duration,
+            # Speed of a single dolphin, as opposed to the whole pool
+            "dolphin_frames_per_second": (
+                dolphin_frames / dolphin_time if dolphin_time > 0 else None
+            ),
+            # Peak use of the scratch directory by a single game
+            "max_game_scratch_bytes": max(
+                (game["scratch_bytes"] for game in self.games), default=0
+            ),
+            "game_stages": _summarize_stages(self.games),
+            "set_stages": _summarize_stages(self.sets),
+            "worker_limits": self.worker_limits,
+            "games": self.games,
+            "failed_games": self.failed_games,
+            "sets": self.sets,
+        }
+
+
+def _write_atomic(path: pathlib.Path, text: str):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_json(report: dict, path: pathlib.Path):
+    _write_atomic(path, json.dumps(report, indent=1))
+
+
+def _format_metric(name, kind, help_text, samples) -> str:
+    text = f"# HELP slp2mp4_{name} {help_text}\n# TYPE slp2mp4_{name} {kind}\n"
+    for labels, value in samples:
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        label_text = f"{{{label_text}}}" if label_text else ""
+        text += f"slp2mp4_{name}{label_text} {value}\n"
+    return text
+
+
+# Only the run totals are exported; per-game details stay in the JSON report
+def write_prometheus(report: dict, path: pathlib.Path):
+    stage_samples = [
+        ({"kind": kind, "stage": stage}, summary["total"])
+        for kind in ("game", "set")
+        for stage, summary in report[f"{kind}_stages"].items()
+    ]
+    metrics = [
+        (
+            "last_run_timestamp_seconds",
+            "gauge",
+            "When the last run finished",
+            [({}, time.time())],
+        ),
+        (
+            "run_duration_seconds",
+            "gauge",
+            "Duration of the last run",
+            [({}, report["duration"])],
+        ),
+        (
+            "stage_seconds",
+            "gauge",
+            "Time spent in each stage during the last run, summed over jobs",
+            stage_samples,
+        ),
+        (
+            "games",
+            "gauge",
+            "Games rendered and failed render attempts in the last run",
+            [
+                ({"result": "rendered"}, report["games_rendered"]),
+                ({"result": "failed"}, report["failed_attempts"]),
+            ],
+        ),
+        (
+            "sets",
+            "gauge",
+            "Videos written and failed in the last run",
+            [
+                ({"result": "written"}, report["sets_written"]),
+                ({"result": "failed"}, report["sets_failed"]),
+            ],
+        ),
+        (
+            "frames_per_second",
+            "gauge",
+            "Frames rendered per second of the last run",
+            [({}, report["frames_per_second"])],
+        ),
+        (
+            "games_per_hour",
+            "gauge",
+            "Games rendered per hour of the last run",
+            [({}, report["games_per_hour"])],
+        ),
+    ]
+    _write_atomic(path, "".join(_format_metric(*metric) for metric in metrics))
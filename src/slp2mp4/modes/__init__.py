@@ -2,6 +2,8 @@ from slp2mp4.modes import mode
 from slp2mp4.modes.single import Single
 from slp2mp4.modes.directory import Directory
 from slp2mp4.modes.zip import Zip
+from slp2mp4.modes.watch import Watch
+from slp2mp4.modes.serve import Serve
 
 MODES = {
     "single": mode.ModeContainer(
@@ -19,4 +21,14 @@ MODES = {
         "recursively convert all replay files in a zip to videos",
         "replay manager zip/directory",
     ),
+    "watch": mode.ModeContainer(
+        Watch,
+        "convert replays in a directory to videos as they're written, until stopped",
+        "directory/directories to watch",
+    ),
+    "serve": mode.ModeContainer(
+        Serve,
+        "render jobs submitted over a local HTTP API, until stopped",
+        "directory/directories jobs may read replays from",
+    ),
 }
@@ -4,6 +4,8 @@ import pathlib
 from slp2mp4.output import Output
 import slp2mp4.orchestrator as orchestrator
 import slp2mp4.config as config
+import slp2mp4.manifest as manifest
+import slp2mp4.scratch as scratch
 
 import pathvalidate
 
@@ -13,10 +15,16 @@ class Mode:
         self.paths = paths
         self.output_directory = output_directory
         self.conf = None
+        self.scratch = None
+        self.failures = []
 
     def iterator(self, location, path):
         raise NotImplementedError("Child must implement `iterator`")
 
+    # Only modes that run until they're stopped (e.g. watch) need to be stopped
+    def stop(self):
+        pass
+
     def get_name(self, prefix, path):
         name = path.name
         if self.conf["runtime"]["prepend_directory"]:
@@ -45,21 +53,60 @@ class Mode:
             for slps, prefix, mp4 in self.iterator(pathlib.Path("."), path)
         ]
 
-    def run(self, dry_run=False):
+    # Records the outputs that were (re)built during this run
+    def _update_manifest(self, outputs_manifest, products, records):
+        failed = {failure.output for failure in self.failures}
+        for output in products:
+            if output.output not in failed:
+                outputs_manifest.update(output, records[output.output])
+        outputs_manifest.save()
+
+    def run(self, dry_run=False, incremental=False, reporter=None):
         self.conf = config.get_config()
         config.translate_and_validate_config(self.conf)
+        with scratch.open_run(self.conf) as self.scratch:
+            return self._run(dry_run, incremental, reporter)
+
+    def _run(self, dry_run, incremental, reporter):
         products = self.get_outputs()
+        outputs_manifest = None
+        if incremental:
+            outputs_manifest = manifest.Manifest(
+                self.output_directory, config.get_render_fingerprint(self.conf)
+            )
+            products = [
+                output
+                for output in products
+                if not outputs_manifest.is_up_to_date(output)
+            ]
         if dry_run:
-            out = ""
-            for output in products:
-                out += f"{output.output}\n"
-                for i in output.inputs:
-                    out += f"\t{i}\n"
-                out += "\n"
-            return out
+            return format_outputs(products)
         else:
             self.output_directory.mkdir(parents=True, exist_ok=True)
-            orchestrator.run(self.conf, products)
+            # Taken before rendering, see Manifest.get_records
+            records = {}
+            if outputs_manifest is not None:
+                records = {
+                    output.output: outputs_manifest.get_records(output)
+                    for output in products
+                }
+            self.failures = orchestrator.run(
+                self.conf, products, self.scratch, reporter
+            )
+            if outputs_manifest is not None:
+                self._update_manifest(outputs_manifest, products, records)
+            if self.failures:
+                return orchestrator.summarize_failures(self.failures)
+
+
+def format_outputs(outputs: list[Output]) -> str:
+    out = ""
+    for output in outputs:
+        out += f"{output.output}\n"
+        for i in output.inputs:
+            out += f"\t{i}\n"
+        out += "\n"
+    return out
 
 
 @dataclasses.dataclass
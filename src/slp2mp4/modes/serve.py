@@ -0,0 +1,68 @@
+import threading
+
+import slp2mp4.orchestrator as orchestrator
+import slp2mp4.server as server
+from slp2mp4.modes.mode import Mode
+
+
+# Renders jobs submitted over HTTP, until stopped (see server.py)
+# The paths are the directories jobs may read replays from
+class Serve(Mode):
+    def __init__(self, paths, output_directory):
+        super().__init__(paths, output_directory)
+        self.stopping = threading.Event()
+        self.pipeline = None
+        # (host, port) once the server is listening
+        self.address = None
+        self.jobs = None
+        self.error = None
+
+    def stop(self):
+        self.stopping.set()
+
+    def _submit(self, output, priority):
+        self.pipeline.submit([output], priority=priority)
+
+    # The server stops if the pipeline fails, rather than taking jobs that
+    # will never be rendered
+    def _run_pipeline(self):
+        try:
+            self.failures = self.pipeline.run()
+        except Exception as e:
+            self.error = e
+            self.jobs.close(f"Rendering failed: {e!r}")
+            self.stopping.set()
+
+    # Jobs name their own outputs, and are rendered whether or not they're up
+    # to date, so dry runs and incremental runs don't apply
+    def _run(self, dry_run, incremental, reporter):
+        self.output_directory.mkdir(parents=True, exist_ok=True)
+        self.jobs = server.Jobs(
+            self.paths, self.output_directory, self._submit, reporter
+        )
+        self.pipeline = orchestrator.Pipeline(
+            self.conf, self.scratch, self.jobs.on_progress, self.jobs.on_set_done
+        )
+        httpd = server.JobServer(
+            (self.conf["serve"]["host"], self.conf["serve"]["port"]), self.jobs
+        )
+        host, port = httpd.server_address[:2]
+        print(f"Serving on http://{host}:{port}", flush=True)
+        self.address = (host, port)
+        pipeline_thread = threading.Thread(target=self._run_pipeline, daemon=True)
+        pipeline_thread.start()
+        server_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        server_thread.start()
+        try:
+            while not self.stopping.wait(1):
+                pass
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        # Jobs that were already submitted are still finished
+        self.pipeline.stop()
+        pipeline_thread.join()
+        if self.error is not None:
+            raise self.error
+        if self.failures:
+            return orchestrator.summarize_failures(self.failures)
@@ -0,0 +1,130 @@
+import pathlib
+import threading
+
+import slp2mp4.config as config
+import slp2mp4.manifest as manifest
+import slp2mp4.orchestrator as orchestrator
+import slp2mp4.watch as watch
+from slp2mp4.modes.directory import Directory
+from slp2mp4.modes import mode
+from slp2mp4.output import Output
+
+
+# Renders replays as they're written, until stopped
+# Like directory mode, each directory is a set. Its games are rendered as soon
+# as they finish, and its video is written once the directory goes quiet (see
+# watch.py); one render pool is kept running the whole time.
+class Watch(Directory):
+    def __init__(self, paths: list[pathlib.Path], output_directory: pathlib.Path):
+        super().__init__(paths, output_directory)
+        self.stopping = threading.Event()
+        self.pipeline = None
+        self.outputs_manifest = None
+        # location -> Output, for sets still being written
+        self.sets = {}
+        # output name -> Output, for sets handed to the pipeline
+        self.finished = {}
+        # output name -> manifest records of the games found so far
+        self.records = {}
+        self.names = set()
+
+    def stop(self):
+        self.stopping.set()
+
+    # A directory that gets new replays after its set was finished makes
+    # another set
+    def _get_unique_name(self, location):
+        name = self.get_name(location.parent, pathlib.Path(location.name))
+        unique = name
+        count = 1
+        while unique in self.names:
+            count += 1
+            unique = name.with_stem(f"{name.stem}_{count}")
+        self.names.add(unique)
+        return unique
+
+    def _on_finished(self, location, slps):
+        output = self.sets.get(location)
+        is_new = output is None
+        if is_new:
+            output = Output([], self._get_unique_name(location))
+            self.sets[location] = output
+        output.inputs.extend(slps)
+        if self.outputs_manifest is not None:
+            self.records.setdefault(output.output, []).extend(
+                self.outputs_manifest.get_records(Output(list(slps), output.output))
+            )
+        if self.pipeline is None:
+            return
+        if is_new:
+            # Copied, since the pipeline only reads its sets later
+            self.pipeline.submit([Output(list(slps), output.output)], sealed=False)
+        else:
+            self.pipeline.extend(output.output, list(slps))
+
+    def _on_quiet(self, location):
+        output = self.sets.pop(location, None)
+        if output is None:
+            return
+        if self.pipeline is None:
+            print(mode.format_outputs([output]), end="", flush=True)
+            return
+        self.finished[output.output] = output
+        self.pipeline.seal(output.output)
+
+    # Called from the pipeline's thread
+    # Sets can fail before they're finished, while their directory is still
+    # being written
+    def _on_set_done(self, output_name, failure):
+        output = self.finished.pop(output_name, None)
+        records = self.records.pop(output_name, None)
+        if failure is not None:
+            print(f"Failed to write {output_name}: {failure.error}", flush=True)
+            return
+        print(f"Wrote {output_name}", flush=True)
+        if self.outputs_manifest is not None:
+            self.outputs_manifest.update(output, records)
+            self.outputs_manifest.save()
+
+    def _run_pipeline(self):
+        self.failures = self.pipeline.run()
+
+    def _run(self, dry_run, incremental, reporter):
+        roots = [(path, self._get_root(path)) for path in self.paths if path.is_dir()]
+        watcher = watch.Watcher(
+            roots,
+            self.conf["watch"]["quiet_time"],
+            self.conf["watch"]["poll_interval"],
+            self.conf["watch"]["polling"],
+            self.conf["runtime"]["scan_threads"],
+        )
+        pipeline_thread = None
+        if not dry_run:
+            if incremental:
+                self.outputs_manifest = manifest.Manifest(
+                    self.output_directory, config.get_render_fingerprint(self.conf)
+                )
+            self.output_directory.mkdir(parents=True, exist_ok=True)
+            self.pipeline = orchestrator.Pipeline(
+                self.conf, self.scratch, reporter, self._on_set_done
+            )
+            pipeline_thread = threading.Thread(target=self._run_pipeline, daemon=True)
+            pipeline_thread.start()
+        handlers = {
+            "finished": self._on_finished,
+            "quiet": self._on_quiet,
+        }
+        try:
+            while not self.stopping.is_set():
+                for event, *data in watcher.poll():
+                    handlers[event](*data)
+        finally:
+            watcher.close()
+        # Sets still being written are finished with the games they have
+        for location in list(self.sets):
+            self._on_quiet(location)
+        if pipeline_thread is not None:
+            self.pipeline.stop()
+            pipeline_thread.join()
+        if self.failures:
+            return orchestrator.summarize_failures(self.failures)
@@ -1,42 +1,82 @@
-import atexit
 import pathlib
 import shutil
 import tempfile
 import zipfile
 
-import pathlib
-
+import slp2mp4.archive as archive
+from slp2mp4.archive import ZipMember
+import slp2mp4.discovery as discovery
 from slp2mp4.modes.directory import Directory
-from slp2mp4.output import Output
 import slp2mp4.util as util
 
 
-# TODO: Use context.json to get names?
-def _make_tmpdir():
-    tmpdir = tempfile.mkdtemp()
-    atexit.register(shutil.rmtree, tmpdir)
-    return pathlib.Path(tmpdir)
+def _get_location_name(name):
+    path = pathlib.PurePosixPath(name)
+    return path.stem if path.suffix.lower() == ".zip" else path.name
 
 
+# Replays are only listed here; they're extracted as they're rendered (see
+# archive.py)
+# TODO: Use context.json to get names?
 class Zip(Directory):
-    def _recursive_find(self, location, path, fromzip=False):
-        if zipfile.is_zipfile(path):
-            tmpdir = _make_tmpdir()
-            with zipfile.ZipFile(path, "r") as zfile:
-                zfile.extractall(path=tmpdir)
-            self._recursive_find(location, tmpdir, True)
-        else:
-            self._add_slps(location, path, fromzip)
-            for child in path.iterdir():
-                if child.is_dir():
-                    self._recursive_find(location / child.name, child, fromzip)
-                elif zipfile.is_zipfile(child):
-                    name = child.name
-                    if child.suffix.lower() == ".zip":
-                        name = child.stem
-                    self._recursive_find(location / name, child, fromzip)
-
-    def _add_slps(self, location, path, fromzip):
-        if not fromzip:
+    def _run(self, dry_run, incremental, reporter):
+        try:
+            return super()._run(dry_run, incremental, reporter)
+        finally:
+            archive.close_archives()
+
+    def iterator(self, _location, path):
+        if not path.is_dir():
+            yield from self._find_in_zip(
+                self._get_root(path), path, str(path.absolute())
+            )
+            return
+        for found in self._walk(path, find_zips=True):
+            for zip_path in found.zips:
+                yield from self._find_in_zip(
+                    found.location / _get_location_name(zip_path.name),
+                    zip_path,
+                    str(zip_path.absolute()),
+                )
+
+    # Nested zips are copied out on their own, since reading their central
+    # directory needs random access; their replays still stay packed
+    def _extract_nested(self, zfile, info, origin, location):
+        fd, tmp = tempfile.mkstemp(dir=self.scratch.get_dir("archives"), suffix=".zip")
+        with open(fd, "wb") as f, zfile.open(info) as member:
+            shutil.copyfileobj(member, f)
+        return self._find_in_zip(
+            location / _get_location_name(info.filename),
+            pathlib.Path(tmp),
+            f"{origin}/{info.filename}",
+        )
+
+    def _find_in_zip(self, location, archive_path, origin):
+        directories = {}
+        nested = []
+        try:
+            with zipfile.ZipFile(archive_path, "r") as zfile:
+                for info in zfile.infolist():
+                    if info.is_dir():
+                        continue
+                    member = pathlib.PurePosixPath(info.filename)
+                    member_location = location.joinpath(*member.parent.parts)
+                    if discovery.is_replay(member.name):
+                        directories.setdefault(member_location, []).append(
+                            ZipMember(archive_path, info.filename, origin, info)
+                        )
+                    elif discovery.is_zip(member.name, lambda: zfile.open(info)):
+                        nested.append(
+                            self._extract_nested(zfile, info, origin, member_location)
+                        )
+        except zipfile.BadZipFile:
+            print(f"Skipping {origin}: not a valid zip")
             return
-        super()._add_slps(location, path)
+        for directory, slps in directories.items():
+            yield (
+                sorted(slps, key=util.natsort),
+                directory.parent,
+                pathlib.Path(directory.name),
+            )
+        for found in nested:
+            yield from found
@@ -1,96 +1,532 @@
 # Commonizes the batching / concatenating of slippi files
-# There are to threads here:
-#   1. The "render" thread, which runs dolphin / does frame dumps
-#   2. The "concat" thread, which contatenates frame-dumps into a single mp4
+# There are three parts here:
+#   1. The "render" processes, which run dolphin / do frame dumps
+#   2. The "concat" processes, which contatenate frame-dumps into a single mp4
+#   3. The main process, which decides what to render next (see scheduler.py)
+#      and hands finished sets to the concat processes. With progressive_sets,
+#      sets are instead assembled in the main process as games finish (see
+#      assembler.py)
+# Workers report back to the main process through the event queue, including
+# the progress of the game they're rendering. Sets are submitted through the
+# event queue too, so a Pipeline can keep its pools running while more sets
+# come in (e.g. from watch mode).
 
+import contextlib
 import multiprocessing
 import os
 import pathlib
 import queue
-import tempfile
+import shutil
+import signal
+import time
 
+import slp2mp4.archive as archive
+import slp2mp4.assembler as assembler
+import slp2mp4.cache as render_cache
+import slp2mp4.concurrency as concurrency
 import slp2mp4.ffmpeg as ffmpeg
+import slp2mp4.memory as memory
+import slp2mp4.metrics as metrics
+import slp2mp4.progress as progress
+import slp2mp4.scheduler as scheduler
+import slp2mp4.scratch as scratch
+import slp2mp4.util as util
 import slp2mp4.video as video
 from slp2mp4.output import Output
 
+_PROGRESS_INTERVAL = 0.5
 
-def _render(conf, slp_queue, video_queue):
-    while True:
-        data = slp_queue.get()
-        if data is None:
-            break
-        output_name, slp_path = data
-        tmp = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
-        video.render(conf, slp_path, pathlib.Path(tmp.name))
-        tmp.close()
-        video_queue.put((output_name, slp_path, tmp.name))
 
+# Progressively assembled sets are built from MPEG-TS segments, which can be
+# appended back to back
+def _get_intermediate_suffix(conf):
+    return ".ts" if conf["runtime"]["progressive_sets"] else ".mp4"
+
+
+# Sends a game's progress to the main process, at most every
+# _PROGRESS_INTERVAL seconds per stage
+class _ProgressSender:
+    def __init__(self, event_queue, output_name, slp_path):
+        self.event_queue = event_queue
+        self.output_name = output_name
+        self.slp_path = slp_path
+        self.stage = None
+        self.stage_start = 0
+        self.last_sent = 0
+
+    def __call__(self, stage, done, total):
+        now = time.monotonic()
+        if stage != self.stage:
+            self.stage = stage
+            self.stage_start = now
+        elif now - self.last_sent < _PROGRESS_INTERVAL:
+            return
+        self.last_sent = now
+        elapsed = now - self.stage_start
+        fps = done / elapsed if elapsed > 0 else 0.0
+        self.event_queue.put(
+            (
+                "progress",
+                self.output_name,
+                self.slp_path,
+                stage,
+                done,
+                total,
+                fps,
+            )
+        )
+
+
+# Cache hits skip dolphin / ffmpeg entirely
+# Returns the size of the dumps
+def _render_game(renderer, cache, slp_path, mp4_path, on_progress, timings):
+    if cache is None:
+        return renderer.render(slp_path, mp4_path, on_progress, timings)
+    with metrics.timed(timings, "cache"):
+        key = cache.get_key(slp_path, mp4_path.suffix)
+        if cache.fetch(key, mp4_path):
+            return 0
+    dump_bytes = renderer.render(slp_path, mp4_path, on_progress, timings)
+    with metrics.timed(timings, "cache"):
+        cache.store(key, mp4_path)
+    return dump_bytes
+
+
+# Missing replays won't show up by trying again
+def _is_retryable(error):
+    return not isinstance(error, FileNotFoundError)
+
+
+def _render(conf, run_scratch, slp_queue, event_queue, ignore_interrupts):
+    if ignore_interrupts:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cache = render_cache.RenderCache(conf) if conf["cache"]["enabled"] else None
+    with video.Renderer(conf, run_scratch) as renderer:
+        while True:
+            data = slp_queue.get()
+            if data is None:
+                break
+            output_name, slp_path, queued_at = data
+            event_queue.put(("started", output_name, slp_path, os.getpid()))
+            timings = {"queue_wait": metrics.get_queue_wait(queued_at)}
+            tmp = run_scratch.make_file("videos", _get_intermediate_suffix(conf))
+            on_progress = _ProgressSender(event_queue, output_name, slp_path)
+            try:
+                with metrics.timed(timings, "total"):
+                    dump_bytes = _render_game(
+                        renderer,
+                        cache,
+                        archive.get_local_path(slp_path, run_scratch),
+                        tmp,
+                        on_progress,
+                        timings,
+                    )
+            except Exception as e:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(tmp)
+                event_queue.put(
+                    (
+                        "failed",
+                        output_name,
+                        slp_path,
+                        repr(e),
+                        _is_retryable(e),
+                        timings,
+                    )
+                )
+            else:
+                # The game's peak use of the scratch directory
+                scratch_bytes = dump_bytes + os.path.getsize(tmp)
+                event_queue.put(
+                    (
+                        "rendered",
+                        output_name,
+                        slp_path,
+                        str(tmp),
+                        timings,
+                        scratch_bytes,
+                    )
+                )
 
-def _concat(conf, video_queue, outputs):
+
+def _concat(conf, video_queue, event_queue, ignore_interrupts):
+    if ignore_interrupts:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
     Ffmpeg = ffmpeg.FfmpegRunner(conf)
-    mp4s = {}
     while True:
         data = video_queue.get()
         if data is None:
             break
-        output_name, slp_path, mp4_path = data
-        if output_name not in mp4s:
-            mp4s[output_name] = {}
-        mp4s[output_name][slp_path] = mp4_path
-        output = list(filter(lambda o: o.output == output_name, outputs))[0]
-        if len(mp4s[output_name]) < len(output.inputs):
-            continue
-        tmpfiles = [pathlib.Path(mp4s[output_name][slp]) for slp in output.inputs]
-        Ffmpeg.concat_videos(tmpfiles, output_name)
-        for tmp in tmpfiles:
-            os.unlink(tmp)
-
-
-def run(conf, outputs: list[Output]):
-    num_procs = conf["runtime"]["parallel"]
-    slp_queue = multiprocessing.Queue()
-    video_queue = multiprocessing.Queue()
-    slp_pool = multiprocessing.Pool(
-        num_procs,
-        _render,
-        (
-            conf,
-            slp_queue,
-            video_queue,
-        ),
-    )
-    video_pool = multiprocessing.Pool(
-        1,
-        _concat,
-        (
-            conf,
-            video_queue,
-            outputs,
-        ),
-    )
-
-    for output in outputs:
-        for slp in output.inputs:
-            slp_queue.put(
-                (
-                    output.output,
-                    slp,
-                )
+        output_name, mp4_paths, queued_at = data
+        timings = {"queue_wait": metrics.get_queue_wait(queued_at)}
+        tmpfiles = [pathlib.Path(mp4) for mp4 in mp4_paths]
+        try:
+            with (
+                metrics.timed(timings, "concat"),
+                util.replacing(pathlib.Path(output_name)) as tmp_output,
+            ):
+                # Nothing to join for single-game sets
+                if len(tmpfiles) == 1:
+                    shutil.move(tmpfiles[0], tmp_output)
+                else:
+                    Ffmpeg.concat_videos(tmpfiles, tmp_output)
+        except Exception as e:
+            event_queue.put(("concat_failed", output_name, repr(e)))
+        else:
+            event_queue.put(("concatenated", output_name, timings))
+        finally:
+            for tmp in tmpfiles:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(tmp)
+
+
+def _get_max_active_sets(conf):
+    max_active_sets = conf["runtime"]["max_active_sets"]
+    return max_active_sets if max_active_sets > 0 else conf["runtime"]["parallel"]
+
+
+def summarize_failures(failures: list[scheduler.Failure]) -> str:
+    summary = f"{len(failures)} video(s) failed:\n"
+    for failure in failures:
+        summary += f"{failure.output}\n"
+        if failure.slp is None:
+            summary += f"\tconcat: {failure.error}\n"
+        else:
+            summary += f"\t{failure.slp} ({failure.attempts} attempt(s)): "
+            summary += f"{failure.error}\n"
+    return summary
+
+
+def _write_report(conf, report):
+    if conf["report"]["json"] is not None:
+        metrics.write_json(report, conf["report"]["json"])
+    if conf["report"]["prometheus"] is not None:
+        metrics.write_prometheus(report, conf["report"]["prometheus"])
+
+
+# Runs in the main process, handing games to the render processes and finished
+# sets to the concat processes (or the set assemblers)
+# on_set_done, if given, is called with each set's output name and its
+# scheduler.Failure (None if it was written) once the set is finished
+class _Dispatcher:
+    def __init__(
+        self,
+        conf,
+        run_scratch,
+        slp_queue,
+        video_queue,
+        event_queue,
+        reporter=None,
+        on_set_done=None,
+    ):
+        self.conf = conf
+        self.run_scratch = run_scratch
+        self.slp_queue = slp_queue
+        self.video_queue = video_queue
+        self.event_queue = event_queue
+        self.outputs = {}
+        self.sched = scheduler.Scheduler(
+            [],
+            _get_max_active_sets(conf),
+            conf["runtime"]["retries"],
+            conf["runtime"]["retry_delay"],
+        )
+        self.progress = progress.Progress(self.sched.costs)
+        self.report = metrics.RunReport(self.sched.costs)
+        self.reporter = reporter
+        self.on_set_done = on_set_done
+        self.workers = conf["runtime"]["parallel"]
+        self.idle = self.workers
+        self.adaptive_limit = None
+        if conf["runtime"]["adaptive"]:
+            self.adaptive_limit = concurrency.AdaptiveLimit(self.workers)
+            self._set_worker_limit(self.adaptive_limit.limit)
+        self.memory_budget = None
+        # (output name, slp) -> pid of the worker rendering it
+        self.render_pids = {}
+        if conf["runtime"]["memory_budget"] > 0:
+            self.memory_budget = memory.MemoryBudget(
+                conf["runtime"]["memory_budget"], memory.get_render_estimate(conf)
+            )
+        self.scratch_budget = scratch.ScratchBudget(conf, run_scratch, self.sched.costs)
+        self.progressive = conf["runtime"]["progressive_sets"]
+        self.assemblers = {}
+        self.stopping = False
+
+    def _set_worker_limit(self, limit):
+        self.progress.worker_limit = limit
+        self.report.on_worker_limit(limit)
+
+    # Adaptive runs only keep some of the workers busy, and the memory and
+    # scratch budgets hold renders back until there's room for them
+    def _can_dispatch(self) -> bool:
+        if self.idle == 0:
+            return False
+        running = self.workers - self.idle
+        if self.memory_budget is not None and not self.memory_budget.can_start(
+            running, self.render_pids.values()
+        ):
+            return False
+        if not self.scratch_budget.can_start(running):
+            return False
+        if self.adaptive_limit is None:
+            return True
+        limit = self.adaptive_limit.update(
+            self.progress.get_frames_done(), running, self.progress.get_mean_fps()
+        )
+        if limit != self.progress.worker_limit:
+            self._set_worker_limit(limit)
+        return running < limit
+
+    def _get_wait_time(self):
+        wait_times = [self.sched.get_wait_time()]
+        if self.adaptive_limit is not None:
+            wait_times.append(self.adaptive_limit.get_wait_time())
+        # Finished renders free memory on their own, but renders that grow are
+        # only noticed by measuring again
+        if self.memory_budget is not None and self.idle > 0:
+            wait_times.append(self.memory_budget.get_wait_time())
+        wait_times.append(self.scratch_budget.get_wait_time())
+        return min((t for t in wait_times if t is not None), default=None)
+
+    def _report(self):
+        if self.reporter is not None:
+            self.reporter(self.progress)
+
+    def _on_started(self, output_name, slp_path, pid):
+        self.render_pids[(output_name, slp_path)] = pid
+
+    def _on_progress(self, output_name, slp_path, *data):
+        if self.memory_budget is not None:
+            self.memory_budget.sample(self.render_pids.values())
+        self.progress.on_progress(progress.GameProgress(output_name, slp_path, *data))
+        self._report()
+
+    def _on_rendered(self, output_name, slp_path, mp4_path, timings, scratch_bytes):
+        self.idle += 1
+        self.render_pids.pop((output_name, slp_path), None)
+        if self.memory_budget is not None:
+            self.memory_budget.on_rendered()
+        self.progress.on_rendered(output_name, slp_path)
+        self.report.on_rendered(output_name, slp_path, timings, scratch_bytes)
+        self._report()
+        mp4_paths = self.sched.on_rendered(output_name, slp_path, mp4_path)
+        if self.sched.is_failed(output_name):
+            # The video was discarded
+            self.scratch_budget.on_failed(output_name, slp_path)
+            return
+        # Cache hits say nothing about how much space rendering takes
+        if "dolphin" not in timings and "stream" not in timings:
+            scratch_bytes = None
+        self.scratch_budget.on_rendered(
+            output_name, slp_path, os.path.getsize(mp4_path), scratch_bytes
+        )
+        if self.progressive:
+            # Unsealed sets don't know their last game yet
+            if self.sched.is_sealed(output_name):
+                self._get_assembler(output_name).add(slp_path, mp4_path)
+        elif mp4_paths is not None:
+            self.video_queue.put((output_name, mp4_paths, time.time()))
+
+    def _get_assembler(self, output_name):
+        if output_name not in self.assemblers:
+            self.assemblers[output_name] = assembler.SetAssembler(
+                self.conf, self.sched.get_output(output_name), self.event_queue
             )
+        return self.assemblers[output_name]
+
+    # Extracted replays are kept for retries until their set is finished
+    def _release_set(self, output_name):
+        output = self.outputs.pop(output_name, None)
+        if output is None:
+            return  # Already released
+        for slp_path in output.inputs:
+            archive.release(slp_path, self.run_scratch)
+        self.scratch_budget.on_set_done(output_name)
+        if self.on_set_done is not None:
+            failure = next(
+                (f for f in reversed(self.sched.failures) if f.output == output_name),
+                None,
+            )
+            self.on_set_done(output_name, failure)
+
+    def _on_failed(self, output_name, slp_path, error, retryable, timings):
+        self.idle += 1
+        self.render_pids.pop((output_name, slp_path), None)
+        self.progress.on_failed(output_name, slp_path)
+        self.report.on_failed(output_name, slp_path, timings)
+        self._report()
+        self.scratch_budget.on_failed(output_name, slp_path)
+        self.sched.on_failed(output_name, slp_path, error, retryable)
+        if self.sched.is_failed(output_name):
+            self._release_set(output_name)
+            if output_name in self.assemblers:
+                self.assemblers.pop(output_name).abort()
+
+    def _on_concatenated(self, output_name, timings):
+        self.assemblers.pop(output_name, None)
+        self.report.on_concatenated(output_name, timings)
+        self._release_set(output_name)
+        self.sched.on_concatenated(output_name)
+
+    def _on_concat_failed(self, output_name, error):
+        self.assemblers.pop(output_name, None)
+        self.sched.on_concat_failed(output_name, error)
+        self._release_set(output_name)
+
+    def _on_submit(self, outputs, sealed, priority):
+        for output in outputs:
+            self.outputs[output.output] = output
+            self.progress.on_submitted(output.output)
+        self.scratch_budget.add(self.sched.add(outputs, sealed, priority))
+        self._report()
+
+    def _on_extend(self, output_name, slps):
+        self.scratch_budget.add(self.sched.extend(output_name, slps))
+        self._report()
+
+    def _on_seal(self, output_name):
+        mp4_paths = self.sched.seal(output_name)
+        if self.sched.is_failed(output_name):
+            return  # Not started yet, or already finished
+        if self.progressive:
+            set_assembler = self._get_assembler(output_name)
+            for slp_path, mp4_path in self.sched.get_rendered(output_name).items():
+                set_assembler.add(slp_path, mp4_path)
+        elif mp4_paths is not None:
+            self.video_queue.put((output_name, mp4_paths, time.time()))
+
+    # Sets that are still unsealed won't get any more games
+    def _on_stop(self):
+        self.stopping = True
+        for output_name in list(self.sched.unsealed):
+            self._on_seal(output_name)
+
+    # Games are only handed out when a worker is idle, so the scheduler always
+    # gets to pick the next game with up-to-date information
+    def run(self):
+        handlers = {
+            "started": self._on_started,
+            "progress": self._on_progress,
+            "rendered": self._on_rendered,
+            "failed": self._on_failed,
+            "concatenated": self._on_concatenated,
+            "concat_failed": self._on_concat_failed,
+            "submit": self._on_submit,
+            "extend": self._on_extend,
+            "seal": self._on_seal,
+            "stop": self._on_stop,
+        }
+        while not (self.stopping and self.sched.is_done()):
+            while self._can_dispatch() and (game := self.sched.next_game()) is not None:
+                self.scratch_budget.on_dispatch(*game)
+                self.slp_queue.put((*game, time.time()))
+                self.idle -= 1
+            try:
+                event, *data = self.event_queue.get(timeout=self._get_wait_time())
+            except queue.Empty:
+                continue  # A retry is ready, or the worker limit / memory is due
+            handlers[event](*data)
+
+
+# Owns the render and concat pools, which keep running until stop() is called
+# and everything submitted before it is finished
+# Sets can be submitted from other threads while run() is dispatching
+# Intermediate files go in run_scratch (see scratch.py)
+# reporter, if given, is called with the progress.Progress as it changes, and
+# on_set_done as each set is finished (see _Dispatcher)
+class Pipeline:
+    def __init__(self, conf, run_scratch, reporter=None, on_set_done=None):
+        self.conf = conf
+        self.run_scratch = run_scratch
+        self.slp_queue = multiprocessing.Queue()
+        self.video_queue = multiprocessing.Queue()
+        self.event_queue = multiprocessing.Queue()
+        self.dispatcher = _Dispatcher(
+            conf,
+            run_scratch,
+            self.slp_queue,
+            self.video_queue,
+            self.event_queue,
+            reporter,
+            on_set_done,
+        )
+
+    # Unsealed sets can get more games with extend() until they're sealed
+    # Sets with a higher priority are rendered first (see scheduler.py)
+    def submit(self, outputs: list[Output], sealed: bool = True, priority: int = 0):
+        self.event_queue.put(("submit", outputs, sealed, priority))
+
+    def extend(self, output_name, slps: list[pathlib.Path]):
+        self.event_queue.put(("extend", output_name, slps))
+
+    def seal(self, output_name):
+        self.event_queue.put(("seal", output_name))
+
+    def stop(self):
+        self.event_queue.put(("stop",))
+
+    # Returns the failures; outputs not listed there were written successfully
+    def run(self) -> list[scheduler.Failure]:
+        num_procs = self.conf["runtime"]["parallel"]
+        num_concat_procs = self.conf["runtime"]["concat_parallel"]
+        # Workers stop with the pipeline, rather than on Ctrl+C, if the caller
+        # handles Ctrl+C itself
+        ignore_interrupts = util.ignores_interrupts()
+        slp_pool = multiprocessing.Pool(
+            num_procs,
+            _render,
+            (
+                self.conf,
+                self.run_scratch,
+                self.slp_queue,
+                self.event_queue,
+                ignore_interrupts,
+            ),
+        )
+        video_pool = multiprocessing.Pool(
+            num_concat_procs,
+            _concat,
+            (
+                self.conf,
+                self.video_queue,
+                self.event_queue,
+                ignore_interrupts,
+            ),
+        )
+
+        self.dispatcher.run()
+
+        for i in range(num_procs):
+            self.slp_queue.put(None)
+
+        self.slp_queue.close()
+        self.slp_queue.join_thread()
+
+        slp_pool.close()
+        slp_pool.join()
 
-    for i in range(num_procs):
-        slp_queue.put(None)
+        for i in range(num_concat_procs):
+            self.video_queue.put(None)
 
-    slp_queue.close()
-    slp_queue.join_thread()
+        self.video_queue.close()
+        self.video_queue.join_thread()
 
-    slp_pool.close()
-    slp_pool.join()
+        video_pool.close()
+        video_pool.join()
 
-    video_queue.put(None)
+        failures = self.dispatcher.sched.failures
+        _write_report(self.conf, self.dispatcher.report.finish(failures))
+        return failures
 
-    video_queue.close()
-    video_queue.join_thread()
 
-    video_pool.close()
-    video_pool.join()
+# Returns the failures; outputs not listed there were written successfully
+# Intermediate files go in run_scratch (see scratch.py)
+# reporter, if given, is called with the batch's progress.Progress as it changes
+def run(
+    conf, outputs: list[Output], run_scratch, reporter=None
+) -> list[scheduler.Failure]:
+    pipeline = Pipeline(conf, run_scratch, reporter)
+    pipeline.submit(outputs)
+    pipeline.stop()
+    return pipeline.run()
@@ -6,5 +6,6 @@ import pathlib
 
 @dataclasses.dataclass
 class Output:
-    inputs: list[pathlib.Path] = dataclasses.field(default_factory=list)  # slps
+    # slps; paths, or archive.ZipMembers in zip mode
+    inputs: list[pathlib.Path] = dataclasses.field(default_factory=list)
     output: pathlib.Path = dataclasses.field(default=pathlib.Path("."))
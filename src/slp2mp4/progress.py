@@ -0,0 +1,172 @@
+# Tracks the progress of a batch from the render workers' progress events
+# Games report frames done per stage ("dolphin" while dumping, "ffmpeg" while
+# muxing). The ETA assumes the rest of the batch renders at the same average
+# frame rate as the part that's already done.
+
+import collections
+import dataclasses
+import pathlib
+import shutil
+import sys
+import time
+
+
+@dataclasses.dataclass
+class GameProgress:
+    output: pathlib.Path
+    slp: pathlib.Path
+    stage: str
+    done: int
+    total: int
+    fps: float
+
+
+class Progress:
+    def __init__(self, costs: dict):
+        # Shared with the scheduler, so it includes games added later
+        self.costs = costs
+        self.finished_frames = 0
+        self.finished_games = 0
+        # (output, slp) -> GameProgress, for games being rendered
+        self.games = {}
+        # Games and frames finished per set
+        self.output_games = collections.Counter()
+        self.output_frames = collections.Counter()
+        # Set when the number of renders is adapted during the batch
+        self.worker_limit = None
+        self.start = time.monotonic()
+
+    @property
+    def total_frames(self) -> int:
+        return sum(self.costs.values())
+
+    @property
+    def total_games(self) -> int:
+        return len(self.costs)
+
+    def on_progress(self, game: GameProgress):
+        self.games[(game.output, game.slp)] = game
+
+    # A set submitted again (e.g. to the job server) starts over
+    def on_submitted(self, output_name):
+        self.output_games.pop(output_name, None)
+        self.output_frames.pop(output_name, None)
+
+    def on_rendered(self, output_name, slp_path):
+        self.games.pop((output_name, slp_path), None)
+        self.finished_frames += self.costs.get(slp_path, 0)
+        self.finished_games += 1
+        self.output_games[output_name] += 1
+        self.output_frames[output_name] += self.costs.get(slp_path, 0)
+
+    def on_failed(self, output_name, slp_path):
+        self.games.pop((output_name, slp_path), None)
+
+    # Muxing takes little time compared to dumping, so a game being muxed
+    # counts as fully rendered
+    def _get_game_frames(self, game: GameProgress) -> int:
+        cost = self.costs.get(game.slp, 0)
+        if game.stage == "dolphin":
+            return min(game.done, cost)
+        return cost
+
+    def get_frames_done(self) -> int:
+        return self.finished_frames + sum(
+            self._get_game_frames(game) for game in self.games.values()
+        )
+
+    def get_output_frames_done(self, output_name) -> int:
+        return self.output_frames[output_name] + sum(
+            self._get_game_frames(game)
+            for (output, _), game in self.games.items()
+            if output == output_name
+        )
+
+    def get_fraction(self) -> float:
+        if self.total_frames == 0:
+            return self.finished_games / max(self.total_games, 1)
+        return min(self.get_frames_done() / self.total_frames, 1.0)
+
+    # Mean fps of the games dolphin is playing, or 0 if there are none
+    def get_mean_fps(self) -> float:
+        fps = [game.fps for game in self.games.values() if game.stage == "dolphin"]
+        return sum(fps) / len(fps) if fps else 0.0
+
+    # Seconds until the batch is rendered, or None until there's a rate
+    def get_eta(self):
+        done = self.get_frames_done()
+        elapsed = time.monotonic() - self.start
+        if done == 0 or elapsed <= 0:
+            return None
+        return (self.total_frames - done) / (done / elapsed)
+
+    def get_summary(self) -> str:
+        summary = (
+            f"{self.get_fraction():4.0%} "
+            f"{self.finished_games}/{self.total_games} games"
+        )
+        if self.worker_limit is not None:
+            summary += f", {self.worker_limit} workers"
+        eta = self.get_eta()
+        if eta is not None:
+            summary += f", ETA {format_duration(eta)}"
+        return summary
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+def format_game(game: GameProgress) -> str:
+    name = pathlib.Path(game.slp.parent.name, game.slp.name)
+    return (
+        f"{str(name):40.40} {game.stage:8} "
+        f"{game.done:>6}/{game.total:<6} frames {game.fps:6.1f} fps"
+    )
+
+
+# Shows a live progress display on a terminal, redrawn in place; other streams
+# (e.g. logs) only get an occasional summary line
+class TerminalReporter:
+    def __init__(self, stream=sys.stderr, interval=0.25, log_interval=30):
+        self.stream = stream
+        self.live = stream.isatty()
+        self.interval = interval if self.live else log_interval
+        self.last_report = 0
+        self.lines = 0
+
+    def _clear(self):
+        if self.lines:
+            self.stream.write(f"\x1b[{self.lines}F\x1b[J")
+        self.lines = 0
+
+    def __call__(self, progress: Progress):
+        now = time.monotonic()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        if not self.live:
+            print(progress.get_summary(), file=self.stream, flush=True)
+            return
+        width = shutil.get_terminal_size().columns
+        bar_width = 30
+        filled = int(progress.get_fraction() * bar_width)
+        lines = [f"[{'#' * filled}{'.' * (bar_width - filled)}] "]
+        lines[0] += progress.get_summary()
+        lines += [f"  {format_game(game)}" for game in progress.games.values()]
+        self._clear()
+        for line in lines:
+            self.stream.write(line[:width] + "\n")
+        self.stream.flush()
+        self.lines = len(lines)
+
+    # Removes the live display once the batch is done
+    def close(self):
+        if self.live:
+            self._clear()
+            self.stream.flush()
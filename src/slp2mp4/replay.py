@@ -1,12 +1,275 @@
 # Logic for interacting with a single slippi replay file
+# https://github.com/project-slippi/slippi-wiki/blob/master/SPEC.md
 
 import dataclasses
+import io
+import mmap
 import pathlib
+import struct
+
+# Melee starts counting frames at -123
+FIRST_FRAME = -123
+FRAMES_PER_SECOND = 60
+
+_RAW_HEADER = b"{U\x03raw[$U#l"
+_METADATA_HEADER = b"U\x08metadata{"
+# Enough to cover the event payloads and game start event
+_HEADER_SIZE = 4096
+
+_EVENT_PAYLOADS = 0x35
+_GAME_START = 0x36
+_PRE_FRAME_UPDATE = 0x37
+_POST_FRAME_UPDATE = 0x38
+_FRAME_START = 0x3A
+_FRAME_BOOKEND = 0x3C
+
+_EMPTY_PLAYER = 3
+_ICE_CLIMBERS = 14
+
+
+class ReplayParseError(ValueError):
+    pass
+
+
+@dataclasses.dataclass
+class Player:
+    port: int
+    character: int
+    type: int
+    name: str | None = None
+    code: str | None = None
+
+
+@dataclasses.dataclass
+class ReplayInfo:
+    version: tuple[int, int, int]
+    stage: int
+    players: list[Player]
+    raw_length: int
+    last_frame: int | None = None
+    start_at: str | None = None
+    # Used to estimate the length of replays without metadata
+    bytes_per_frame: int = dataclasses.field(default=0, repr=False)
+
+    @property
+    def num_frames(self) -> int:
+        if self.last_frame is not None:
+            return self.last_frame - FIRST_FRAME + 1
+        if self.bytes_per_frame:
+            return self.raw_length // self.bytes_per_frame
+        return 0
+
+    @property
+    def duration(self) -> float:
+        return self.num_frames / FRAMES_PER_SECOND
+
+
+# Minimal UBJSON decoder for the metadata block
+class _UbjsonReader:
+    _NUMBERS = {
+        b"i": struct.Struct(">b"),
+        b"U": struct.Struct(">B"),
+        b"I": struct.Struct(">h"),
+        b"l": struct.Struct(">i"),
+        b"L": struct.Struct(">q"),
+        b"d": struct.Struct(">f"),
+        b"D": struct.Struct(">d"),
+    }
+
+    def __init__(self, buf, pos):
+        self.buf = buf
+        self.pos = pos
+
+    def _read(self, size):
+        if self.pos + size > len(self.buf):
+            raise ReplayParseError("Unexpected end of UBJSON data")
+        data = self.buf[self.pos : self.pos + size]
+        self.pos += size
+        return data
+
+    def _read_marker(self):
+        marker = self._read(1)
+        while marker == b"N":
+            marker = self._read(1)
+        return marker
+
+    def _read_length(self):
+        length = self.read_value(self._read_marker())
+        if not isinstance(length, int) or length < 0:
+            raise ReplayParseError("Invalid UBJSON length")
+        return length
+
+    def _read_string(self):
+        return bytes(self._read(self._read_length())).decode("utf-8", "replace")
+
+    def _read_container_params(self):
+        value_type = count = None
+        if self.buf[self.pos : self.pos + 1] == b"$":
+            self.pos += 1
+            value_type = self._read(1)
+        if self.buf[self.pos : self.pos + 1] == b"#":
+            self.pos += 1
+            count = self._read_length()
+        return value_type, count
+
+    def _read_array(self):
+        value_type, count = self._read_container_params()
+        values = []
+        while count is None or len(values) < count:
+            marker = value_type or self._read_marker()
+            if count is None and marker == b"]":
+                break
+            values.append(self.read_value(marker))
+        return values
+
+    def _read_object(self):
+        value_type, count = self._read_container_params()
+        values = {}
+        while count is None or len(values) < count:
+            if count is None and self.buf[self.pos : self.pos + 1] == b"}":
+                self.pos += 1
+                break
+            key = self._read_string()
+            values[key] = self.read_value(value_type or self._read_marker())
+        return values
+
+    def read(self):
+        return self.read_value(self._read_marker())
+
+    def read_value(self, marker):
+        if marker in self._NUMBERS:
+            number = self._NUMBERS[marker]
+            return number.unpack(self._read(number.size))[0]
+        if marker == b"S" or marker == b"H":
+            return self._read_string()
+        if marker == b"C":
+            return bytes(self._read(1)).decode("latin-1")
+        if marker == b"T":
+            return True
+        if marker == b"F":
+            return False
+        if marker == b"Z":
+            return None
+        if marker == b"[":
+            return self._read_array()
+        if marker == b"{":
+            return self._read_object()
+        raise ReplayParseError(f"Unknown UBJSON marker {marker!r}")
+
+
+def _parse_payload_sizes(buf, pos):
+    if buf[pos] != _EVENT_PAYLOADS:
+        raise ReplayParseError("Raw data does not start with event payloads")
+    size = buf[pos + 1]
+    sizes = {_EVENT_PAYLOADS: size}
+    for entry in range(pos + 2, pos + size, 3):
+        command, payload_size = struct.unpack_from(">BH", buf, entry)
+        sizes[command] = payload_size
+    return sizes
+
+
+def _parse_game_start(buf, pos):
+    if buf[pos] != _GAME_START:
+        raise ReplayParseError("Game start event not found")
+    version = tuple(buf[pos + 1 : pos + 4])
+    (stage,) = struct.unpack_from(">H", buf, pos + 0x13)
+    players = []
+    for port in range(4):
+        offset = pos + 0x65 + 0x24 * port
+        character, player_type = buf[offset], buf[offset + 1]
+        if player_type != _EMPTY_PLAYER:
+            players.append(Player(port, character, player_type))
+    return version, stage, players
+
+
+def _get_bytes_per_frame(sizes, players):
+    per_player = sizes.get(_PRE_FRAME_UPDATE, 0) + sizes.get(_POST_FRAME_UPDATE, 0)
+    per_player += 2  # command bytes
+    characters = sum(
+        2 if player.character == _ICE_CLIMBERS else 1 for player in players
+    )
+    per_frame = per_player * characters
+    for command in (_FRAME_START, _FRAME_BOOKEND):
+        if command in sizes:
+            per_frame += sizes[command] + 1
+    return per_frame
+
+
+def _apply_metadata(info, metadata):
+    info.last_frame = metadata.get("lastFrame")
+    info.start_at = metadata.get("startAt")
+    players = metadata.get("players", {})
+    for player in info.players:
+        names = players.get(str(player.port), {}).get("names", {})
+        player.name = names.get("netplay")
+        player.code = names.get("code")
+
+
+# Parses the replay header, game start event, and metadata from any buffer
+# (bytes, mmap, ...); only the touched ranges are read
+def parse_info(buf) -> ReplayInfo:
+    if buf[: len(_RAW_HEADER)] != _RAW_HEADER:
+        raise ReplayParseError("Missing UBJSON raw header")
+    raw_start = len(_RAW_HEADER) + 4
+    (raw_length,) = struct.unpack_from(">i", buf, len(_RAW_HEADER))
+    # The length is only written once the game has finished
+    complete = raw_length > 0
+    if not complete:
+        raw_length = len(buf) - raw_start
+    try:
+        sizes = _parse_payload_sizes(buf, raw_start)
+        game_start = raw_start + sizes[_EVENT_PAYLOADS] + 1
+        version, stage, players = _parse_game_start(buf, game_start)
+    except (IndexError, struct.error) as e:
+        raise ReplayParseError(f"Truncated replay: {e}") from e
+    info = ReplayInfo(
+        version=version,
+        stage=stage,
+        players=players,
+        raw_length=raw_length,
+        bytes_per_frame=_get_bytes_per_frame(sizes, players),
+    )
+    metadata_start = raw_start + raw_length
+    if complete and (
+        buf[metadata_start : metadata_start + len(_METADATA_HEADER)] == _METADATA_HEADER
+    ):
+        reader = _UbjsonReader(buf, metadata_start + len(_METADATA_HEADER) - 1)
+        _apply_metadata(info, reader.read())
+    return info
+
+
+def read_info(slp_path: pathlib.Path) -> ReplayInfo:
+    with slp_path.open("rb") as f:
+        try:
+            f.fileno()
+        except io.UnsupportedOperation:
+            # e.g. a replay still inside a zip, where reaching the metadata
+            # means decompressing all of it; the length is estimated instead
+            return parse_info(f.read(_HEADER_SIZE))
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e:
+            raise ReplayParseError(f"Empty replay: {slp_path}") from e
+        with buf:
+            return parse_info(buf)
+
+
+# Whether the game has ended, i.e. its length was written into the header
+def is_complete(slp_path: pathlib.Path) -> bool:
+    with slp_path.open("rb") as f:
+        head = f.read(len(_RAW_HEADER) + 4)
+    if len(head) < len(_RAW_HEADER) + 4 or not head.startswith(_RAW_HEADER):
+        return False
+    (raw_length,) = struct.unpack_from(">i", head, len(_RAW_HEADER))
+    return raw_length > 0
 
 
 @dataclasses.dataclass
 class ReplayFile:
     slp_path: pathlib.Path
+    _info: ReplayInfo | None = dataclasses.field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __post_init__(self):
         if not self.slp_path.exists():
@@ -14,3 +277,15 @@ class ReplayFile:
 
     def get_slp_filename(self):
         return str(self.slp_path.absolute())
+
+    def get_info(self) -> ReplayInfo:
+        if self._info is None:
+            self._info = read_info(self.slp_path)
+        return self._info
+
+    # 0 if the replay can't be parsed
+    def get_num_frames(self) -> int:
+        try:
+            return self.get_info().num_frames
+        except (ReplayParseError, OSError):
+            return 0
@@ -0,0 +1,284 @@
+# Decides which game the render pool works on next
+# Only a bounded number of sets are "active" (started but not yet
+# concatenated) at a time. Workers are kept on the oldest active set so it can
+# be concatenated early, which also bounds how many temporary videos exist at
+# once. Sets are activated longest first, and games within a set are rendered
+# longest first, so a long game doesn't run alone at the end of a batch.
+# Failed games are retried with exponential backoff; a set whose game runs out
+# of retries is marked failed without holding up the other sets.
+# Sets can be added while the pool is running. Unsealed sets can still get
+# more games, and are only finished once sealed; while they wait for games,
+# they don't count towards the active sets.
+# Sets with a higher priority are activated first, even past the bound, and
+# their games are rendered before those of other active sets.
+
+import collections
+import contextlib
+import dataclasses
+import heapq
+import itertools
+import os
+import pathlib
+import time
+
+import slp2mp4.replay as replay
+from slp2mp4.output import Output
+
+
+# Render time scales with game length, so frame count is used as the cost
+def estimate_frames(slp_path) -> int:
+    try:
+        return replay.read_info(slp_path).num_frames
+    except (replay.ReplayParseError, OSError):
+        return 0
+
+
+@dataclasses.dataclass
+class Failure:
+    output: pathlib.Path
+    slp: pathlib.Path | None  # None if the concat failed
+    error: str
+    attempts: int = 1
+
+
+@dataclasses.dataclass
+class _SetState:
+    output: Output
+    undispatched: list[pathlib.Path]
+    rendered: dict = dataclasses.field(default_factory=dict)
+    attempts: collections.Counter = dataclasses.field(
+        default_factory=collections.Counter
+    )
+    in_flight: int = 0
+    failed: bool = False
+    priority: int = 0
+
+
+def _discard(mp4_path):
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(mp4_path)
+
+
+class Scheduler:
+    def __init__(
+        self,
+        outputs: list[Output],
+        max_active_sets: int,
+        retries: int = 0,
+        retry_delay: float = 0,
+    ):
+        self.max_active_sets = max_active_sets
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.costs = {}
+        # Heap of (-priority, tiebreaker, output)
+        self.pending = []
+        self.pending_counter = itertools.count()
+        # Insertion ordered, so the oldest set is first
+        self.active = {}
+        self.unsealed = set()
+        # Heap of (ready time, tiebreaker, output name, slp)
+        self.retry_heap = []
+        self.retry_counter = itertools.count()
+        self.failures = []
+        self.add(outputs)
+
+    def _add_costs(self, slps) -> dict:
+        costs = {slp: estimate_frames(slp) for slp in slps if slp not in self.costs}
+        self.costs.update(costs)
+        return costs
+
+    # Added sets are queued after the pending ones of the same priority
+    # Returns the costs of the new games
+    def add(
+        self, outputs: list[Output], sealed: bool = True, priority: int = 0
+    ) -> dict:
+        costs = self._add_costs(slp for output in outputs for slp in output.inputs)
+        for output in sorted(
+            (output for output in outputs if output.inputs),
+            key=lambda output: sum(self.costs[slp] for slp in output.inputs),
+            reverse=True,
+        ):
+            heapq.heappush(
+                self.pending, (-priority, next(self.pending_counter), output)
+            )
+        if not sealed:
+            self.unsealed.update(output.output for output in outputs)
+        return costs
+
+    # Adds games to an unsealed set
+    # Returns the costs of the new games
+    def extend(self, output_name, slps: list[pathlib.Path]) -> dict:
+        state = self.active.get(output_name)
+        if output_name not in self.unsealed or (state is not None and state.failed):
+            return {}
+        costs = self._add_costs(slps)
+        if state is not None:
+            state.output.inputs.extend(slps)
+            state.undispatched.extend(slps)
+            state.undispatched.sort(key=lambda slp: self.costs[slp], reverse=True)
+            return costs
+        for _, _, output in self.pending:
+            if output.output == output_name:
+                output.inputs.extend(slps)
+        return costs
+
+    # Returns the set's videos, in order, if all of its games are rendered
+    def seal(self, output_name):
+        self.unsealed.discard(output_name)
+        return self._get_videos(output_name)
+
+    def is_sealed(self, output_name) -> bool:
+        return output_name not in self.unsealed
+
+    def get_rendered(self, output_name) -> dict:
+        return self.active[output_name].rendered
+
+    def _is_waiting(self, state) -> bool:
+        return (
+            state.output.output in self.unsealed
+            and not state.undispatched
+            and state.in_flight == 0
+        )
+
+    def _get_num_active(self) -> int:
+        return sum(not self._is_waiting(state) for state in self.active.values())
+
+    # Sets with a higher priority than every active set are urgent
+    def _can_activate(self, urgent_only: bool = False) -> bool:
+        if not self.pending:
+            return False
+        negative_priority, _, output = self.pending[0]
+        if output.output in self.active:
+            return False  # An earlier set of the same name is still finishing
+        urgent = all(
+            -negative_priority > state.priority for state in self.active.values()
+        )
+        if urgent_only:
+            return urgent
+        return urgent or self._get_num_active() < self.max_active_sets
+
+    def _activate(self):
+        negative_priority, _, output = heapq.heappop(self.pending)
+        undispatched = sorted(
+            output.inputs, key=lambda slp: self.costs[slp], reverse=True
+        )
+        self.active[output.output] = _SetState(
+            output, undispatched, priority=-negative_priority
+        )
+
+    def _dispatch(self, state, slp_path):
+        state.in_flight += 1
+        return state.output.output, slp_path
+
+    def _pop_retry(self):
+        while self.retry_heap and self.retry_heap[0][0] <= time.monotonic():
+            _, _, output_name, slp_path = heapq.heappop(self.retry_heap)
+            state = self.active.get(output_name)
+            if state is not None and not state.failed:
+                return self._dispatch(state, slp_path)
+        return None
+
+    # Returns the next (output name, slp) to render, or None if the pool should
+    # wait for active sets to finish or retries to become ready
+    def next_game(self):
+        if (game := self._pop_retry()) is not None:
+            return game
+        while self._can_activate(urgent_only=True):
+            self._activate()
+        # Sorting is stable, so the oldest set still goes first
+        for state in sorted(self.active.values(), key=lambda state: -state.priority):
+            if state.undispatched:
+                return self._dispatch(state, state.undispatched.pop(0))
+        while self._can_activate():
+            self._activate()
+            state = next(reversed(self.active.values()))
+            if state.undispatched:
+                return self._dispatch(state, state.undispatched.pop(0))
+        return None
+
+    # Seconds until the next retry is ready, or None if there are no retries
+    def get_wait_time(self):
+        if not self.retry_heap:
+            return None
+        return max(0, self.retry_heap[0][0] - time.monotonic())
+
+    def _finish_failed(self, output_name):
+        state = self.active[output_name]
+        if state.in_flight == 0:
+            del self.active[output_name]
+            self.unsealed.discard(output_name)
+
+    def _fail_set(self, state):
+        state.failed = True
+        state.undispatched.clear()
+        for mp4_path in state.rendered.values():
+            _discard(mp4_path)
+        state.rendered.clear()
+
+    # Returns the set's videos, in order, once all of its games are rendered
+    def on_rendered(self, output_name, slp_path, mp4_path):
+        state = self.active.get(output_name)
+        if state is None:
+            _discard(mp4_path)
+            return None
+        state.in_flight -= 1
+        if state.failed:
+            _discard(mp4_path)
+            self._finish_failed(output_name)
+            return None
+        state.rendered[slp_path] = mp4_path
+        return self._get_videos(output_name)
+
+    def _get_videos(self, output_name):
+        state = self.active.get(output_name)
+        if (
+            state is None
+            or state.failed
+            or output_name in self.unsealed
+            or len(state.rendered) < len(state.output.inputs)
+        ):
+            return None
+        return [state.rendered[slp] for slp in state.output.inputs]
+
+    def on_failed(self, output_name, slp_path, error: str, retryable: bool):
+        state = self.active.get(output_name)
+        if state is None:
+            return
+        state.in_flight -= 1
+        state.attempts[slp_path] += 1
+        attempts = state.attempts[slp_path]
+        if state.failed:
+            pass
+        elif retryable and attempts <= self.retries:
+            ready = time.monotonic() + self.retry_delay * 2 ** (attempts - 1)
+            heapq.heappush(
+                self.retry_heap,
+                (ready, next(self.retry_counter), output_name, slp_path),
+            )
+            return
+        else:
+            self.failures.append(Failure(output_name, slp_path, error, attempts))
+            self._fail_set(state)
+        self._finish_failed(output_name)
+
+    def on_concatenated(self, output_name):
+        del self.active[output_name]
+
+    def on_concat_failed(self, output_name, error: str):
+        state = self.active.get(output_name)
+        if state is None or state.failed:
+            return  # Already reported
+        self.failures.append(Failure(output_name, None, error))
+        del self.active[output_name]
+        self.unsealed.discard(output_name)
+
+    def get_output(self, output_name) -> Output:
+        return self.active[output_name].output
+
+    def is_failed(self, output_name) -> bool:
+        state = self.active.get(output_name)
+        return state is None or state.failed
+
+    def is_done(self) -> bool:
+        return not self.pending and not self.active
@@ -0,0 +1,212 @@
+# Where a run keeps its intermediate files
+# Each run gets its own directory under `scratch_dir` (the system's temporary
+# directory by default), holding the dumps and videos of the games being
+# rendered and the replays extracted from zips. Dolphin's user directories
+# and comm files, which are small and rewritten for every game, can be kept in
+# a separate RAM-backed directory (`ram_dir`, e.g. /dev/shm) instead.
+# A run holds a lock on its directories for as long as it's running, so
+# directories left behind by runs that crashed are found (and removed) by the
+# next run to start.
+# ScratchBudget holds renders back while the scratch directory is short on
+# space, until finished sets free up theirs.
+
+import collections
+import contextlib
+import dataclasses
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+
+import slp2mp4.replay as replay
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+_PREFIX = "slp2mp4-"
+_LOCK_NAME = "lock"
+# A run's directory is briefly unlocked while it's being made
+_LOCK_GRACE = 60
+
+_MB = 1024 * 1024
+# 16-bit stereo PCM at 48 kHz, in bits per second
+_AUDIO_DUMP_BITRATE = 48000 * 2 * 16
+# More than any sensible `audio_args` would use
+_AUDIO_BITRATE = 320 * 1000
+# Replays whose length is unknown are assumed to be a full 8 minute game
+_DEFAULT_FRAMES = 8 * 60 * replay.FRAMES_PER_SECOND
+# Space left free for everything else on the scratch filesystem
+_MIN_FREE = 512 * _MB
+# Seconds between checks of the free space while renders are held back
+_POLL_INTERVAL = 5
+
+
+def _try_lock(f) -> bool:
+    try:
+        if os.name == "nt":
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _is_abandoned(run_dir: pathlib.Path) -> bool:
+    try:
+        # Not created if it's missing, since its run may be about to take it
+        f = open(run_dir / _LOCK_NAME, "r+")
+    except FileNotFoundError:
+        try:
+            return time.time() - run_dir.stat().st_mtime > _LOCK_GRACE
+        except FileNotFoundError:
+            return False  # Cleaned up by someone else
+    with f:
+        return _try_lock(f)
+
+
+# Removes the directories of runs that are no longer running
+def clean_up(root: pathlib.Path):
+    for run_dir in root.glob(f"{_PREFIX}*"):
+        if run_dir.is_dir() and _is_abandoned(run_dir):
+            print(f"Removing leftovers of a previous run: {run_dir}")
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+# Sum of the sizes of the regular files under `path`
+def get_size(path: pathlib.Path) -> int:
+    total = 0
+    with contextlib.suppress(FileNotFoundError):
+        for entry in os.scandir(path):
+            with contextlib.suppress(FileNotFoundError):
+                if entry.is_dir(follow_symlinks=False):
+                    total += get_size(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+# Plain paths, so it can be handed to worker processes
+@dataclasses.dataclass(frozen=True)
+class Scratch:
+    path: pathlib.Path
+    ram_path: pathlib.Path
+
+    def get_dir(self, kind: str, ram: bool = False) -> pathlib.Path:
+        directory = (self.ram_path if ram else self.path) / kind
+        directory.mkdir(exist_ok=True)
+        return directory
+
+    def make_dir(self, kind: str, ram: bool = False) -> pathlib.Path:
+        return pathlib.Path(tempfile.mkdtemp(dir=self.get_dir(kind, ram)))
+
+    def make_file(self, kind: str, suffix: str = "") -> pathlib.Path:
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.get_dir(kind))
+        os.close(fd)
+        return pathlib.Path(path)
+
+
+@contextlib.contextmanager
+def _make_run_dir(root: pathlib.Path):
+    clean_up(root)
+    run_dir = pathlib.Path(tempfile.mkdtemp(prefix=_PREFIX, dir=root))
+    try:
+        with open(run_dir / _LOCK_NAME, "a") as lock:
+            _try_lock(lock)
+            yield run_dir
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def open_run(conf):
+    root = conf["runtime"]["scratch_dir"]
+    if root is None:
+        root = pathlib.Path(tempfile.gettempdir())
+    with contextlib.ExitStack() as exit_stack:
+        path = exit_stack.enter_context(_make_run_dir(root))
+        ram_path = path
+        if conf["runtime"]["ram_dir"] is not None:
+            ram_path = exit_stack.enter_context(
+                _make_run_dir(conf["runtime"]["ram_dir"])
+            )
+        yield Scratch(path, ram_path)
+
+
+# Peak scratch space used by rendering a game: Dolphin's dumps (unless
+# they're streamed) plus the rendered video
+def estimate_game_bytes(conf, num_frames: int) -> int:
+    seconds = (num_frames or _DEFAULT_FRAMES) / replay.FRAMES_PER_SECOND
+    video = conf["dolphin"]["bitrate"] * 1000 * seconds / 8
+    total = video + _AUDIO_BITRATE * seconds / 8
+    if not conf["dolphin"]["stream_dumps"]:
+        total += video + _AUDIO_DUMP_BITRATE * seconds / 8
+    return int(total)
+
+
+# Every game being rendered reserves its estimated peak, and rendered games
+# take up their size until their set is finished. Estimates are scaled by the
+# largest ratio of actual to estimated use seen so far.
+class ScratchBudget:
+    def __init__(self, conf, run_scratch: Scratch, costs: dict):
+        self.conf = conf
+        self.path = run_scratch.path
+        self.limit = conf["runtime"]["scratch_limit"] * _MB or None
+        self.estimates = {}
+        # Which game comes next isn't known up front
+        self.largest = 0
+        self.add(costs)
+        self.scale = None
+        self.in_flight = {}
+        self.stored = collections.Counter()
+        self.last_check = 0
+        self.waiting = False
+
+    # Games can be added while rendering (see scheduler.py)
+    def add(self, costs: dict):
+        for slp, frames in costs.items():
+            self.estimates[slp] = estimate_game_bytes(self.conf, frames)
+            self.largest = max(self.largest, self.estimates[slp])
+
+    def _get_scale(self) -> float:
+        return 1 if self.scale is None else self.scale
+
+    def can_start(self, running: int) -> bool:
+        self.waiting = False
+        if running == 0:
+            return True
+        self.last_check = time.monotonic()
+        reserved = (sum(self.in_flight.values()) + self.largest) * self._get_scale()
+        if self.limit is not None and reserved + sum(self.stored.values()) > (
+            self.limit
+        ):
+            self.waiting = True
+        elif reserved > shutil.disk_usage(self.path).free - _MIN_FREE:
+            self.waiting = True
+        return not self.waiting
+
+    # Seconds until the free space is worth checking again, if waiting for it
+    def get_wait_time(self):
+        if not self.waiting:
+            return None
+        return max(0, self.last_check + _POLL_INTERVAL - time.monotonic())
+
+    def on_dispatch(self, output_name, slp_path):
+        self.in_flight[(output_name, slp_path)] = self.estimates.get(slp_path, 0)
+
+    # scratch_bytes is None if the game wasn't actually rendered
+    def on_rendered(self, output_name, slp_path, mp4_bytes: int, scratch_bytes):
+        estimate = self.in_flight.pop((output_name, slp_path), 0)
+        if estimate > 0 and scratch_bytes is not None:
+            ratio = scratch_bytes / estimate
+            self.scale = ratio if self.scale is None else max(self.scale, ratio)
+        self.stored[output_name] += mp4_bytes
+
+    def on_failed(self, output_name, slp_path):
+        self.in_flight.pop((output_name, slp_path), None)
+
+    def on_set_done(self, output_name):
+        self.stored.pop(output_name, None)
@@ -0,0 +1,277 @@
+# Local job server for serve mode
+# Clients submit jobs over HTTP, and every job is rendered by the server's one
+# render pool and concat pool, so several clients don't oversubscribe the
+# machine with pools of their own. A job is a set of replays, the name of its
+# video, and optionally a priority (higher goes first, see scheduler.py).
+# There's no authentication: the server only listens on localhost unless
+# configured otherwise, and only renders replays from the directories it was
+# given, into its output directory.
+#
+#   POST /jobs       {"inputs": ["/a/Game_1.slp", ...], "output": "name",
+#                     "priority": 0}
+#   GET  /jobs       every job
+#   GET  /jobs/<id>  one job
+#   GET  /status     what the pools are doing
+#
+# Jobs go from "queued" to "rendering" and "concatenating", and end up "done"
+# or "failed" (with an "error").
+
+import dataclasses
+import http
+import http.server
+import itertools
+import json
+import pathlib
+import threading
+import urllib.parse
+
+import pathvalidate
+
+import slp2mp4.discovery as discovery
+from slp2mp4.output import Output
+
+_MAX_REQUEST_SIZE = 1024 * 1024
+
+
+class JobError(ValueError):
+    def __init__(self, message, status=http.HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclasses.dataclass
+class Job:
+    id: int
+    output: Output
+    priority: int
+    state: str = "queued"
+    games_done: int = 0
+    progress: float = 0.0
+    error: str | None = None
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "output": str(self.output.output),
+            "inputs": [str(slp) for slp in self.output.inputs],
+            "priority": self.priority,
+            "state": self.state,
+            "games": len(self.output.inputs),
+            "games_done": self.games_done,
+            "progress": self.progress,
+            "error": self.error,
+        }
+
+
+# Keeps track of the jobs; updated from the pipeline's thread, and read from
+# the request handlers' threads
+# submit is called with each new job's Output and priority
+class Jobs:
+    def __init__(
+        self,
+        roots: list[pathlib.Path],
+        output_directory: pathlib.Path,
+        submit,
+        reporter=None,
+    ):
+        self.roots = [root.resolve() for root in roots]
+        self.output_directory = output_directory
+        self.submit_output = submit
+        self.reporter = reporter
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        # id -> Job
+        self.jobs = {}
+        # output name -> Job, for jobs that aren't finished
+        self.unfinished = {}
+        self.status = {"games_rendered": 0, "rendering": []}
+        # Why no more jobs are taken, once the pipeline has failed
+        self.error = None
+
+    def _get_input(self, value) -> pathlib.Path:
+        if not isinstance(value, str):
+            raise JobError("Inputs must be paths")
+        path = pathlib.Path(value).resolve()
+        if not any(path.is_relative_to(root) for root in self.roots):
+            raise JobError(f"{value} is not in a served directory")
+        if not discovery.is_replay(path.name) or not path.is_file():
+            raise JobError(f"{value} is not a replay")
+        return path
+
+    def _get_output(self, value) -> pathlib.Path:
+        if not isinstance(value, str):
+            raise JobError("Output must be a file name")
+        name = pathvalidate.sanitize_filename(value)
+        if not name:
+            raise JobError(f"{value!r} is not a valid file name")
+        if not name.lower().endswith(".mp4"):
+            name += ".mp4"
+        return self.output_directory / name
+
+    # Returns the new job
+    def submit(self, request) -> dict:
+        if not isinstance(request, dict):
+            raise JobError("A job must be an object")
+        inputs = request.get("inputs")
+        if not isinstance(inputs, list) or not inputs:
+            raise JobError("Inputs must be a list of replays")
+        slps = [self._get_input(value) for value in inputs]
+        output_name = self._get_output(request.get("output"))
+        priority = request.get("priority", 0)
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise JobError("Priority must be an integer")
+        with self.lock:
+            if self.error is not None:
+                raise JobError(self.error, http.HTTPStatus.SERVICE_UNAVAILABLE)
+            if output_name in self.unfinished:
+                raise JobError(
+                    f"{output_name.name} is already being rendered",
+                    http.HTTPStatus.CONFLICT,
+                )
+            job = Job(next(self.ids), Output(slps, output_name), priority)
+            self.jobs[job.id] = job
+            self.unfinished[output_name] = job
+            # Copied, since the pipeline only reads its sets later
+            self.submit_output(Output(list(slps), output_name), priority)
+            return job.to_json()
+
+    def get_jobs(self) -> list[dict]:
+        with self.lock:
+            return [job.to_json() for job in self.jobs.values()]
+
+    # Returns None if there's no such job
+    def get_job(self, job_id: str):
+        with self.lock:
+            job = self.jobs.get(int(job_id)) if job_id.isdigit() else None
+            return None if job is None else job.to_json()
+
+    def get_status(self) -> dict:
+        with self.lock:
+            states = {}
+            for job in self.jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {**self.status, "jobs": states}
+
+    def _update(self, job: Job, progress):
+        name = job.output.output
+        job.games_done = progress.output_games[name]
+        total = sum(progress.costs.get(slp, 0) for slp in job.output.inputs)
+        if total > 0:
+            done = progress.get_output_frames_done(name)
+            job.progress = min(done / total, 1.0)
+        else:
+            job.progress = job.games_done / len(job.output.inputs)
+        if job.games_done == len(job.output.inputs):
+            job.state = "concatenating"
+        elif job.games_done or any(output == name for output, _ in progress.games):
+            job.state = "rendering"
+
+    # The pipeline's reporter
+    def on_progress(self, progress):
+        with self.lock:
+            for job in self.unfinished.values():
+                self._update(job, progress)
+            self.status = {
+                "games_rendered": progress.finished_games,
+                "worker_limit": progress.worker_limit,
+                "rendering": [
+                    {
+                        "output": str(game.output),
+                        "slp": str(game.slp),
+                        "stage": game.stage,
+                        "frames_done": game.done,
+                        "frames": game.total,
+                        "fps": game.fps,
+                    }
+                    for game in progress.games.values()
+                ],
+            }
+        if self.reporter is not None:
+            self.reporter(progress)
+
+    def on_set_done(self, output_name, failure):
+        with self.lock:
+            job = self.unfinished.pop(output_name, None)
+            if job is None:
+                return
+            if failure is None:
+                job.state = "done"
+                job.progress = 1.0
+            else:
+                job.state = "failed"
+                job.error = failure.error
+
+    # Fails every unfinished job, and refuses new ones
+    def close(self, error: str):
+        with self.lock:
+            self.error = error
+            for job in self.unfinished.values():
+                job.state = "failed"
+                job.error = error
+            self.unfinished.clear()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server_version = "slp2mp4"
+
+    # The progress display shares the terminal
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, {"error": message})
+
+    def _get_path(self):
+        return urllib.parse.urlsplit(self.path).path.rstrip("/")
+
+    def do_GET(self):
+        jobs = self.server.jobs
+        path = self._get_path()
+        if path == "/jobs":
+            self._send(http.HTTPStatus.OK, jobs.get_jobs())
+        elif path == "/status":
+            self._send(http.HTTPStatus.OK, jobs.get_status())
+        elif path.startswith("/jobs/"):
+            job = jobs.get_job(path.removeprefix("/jobs/"))
+            if job is None:
+                self._send_error(http.HTTPStatus.NOT_FOUND, "No such job")
+            else:
+                self._send(http.HTTPStatus.OK, job)
+        else:
+            self._send_error(http.HTTPStatus.NOT_FOUND, "Not found")
+
+    def do_POST(self):
+        if self._get_path() != "/jobs":
+            self._send_error(http.HTTPStatus.NOT_FOUND, "Not found")
+            return
+        try:
+            size = int(self.headers.get("Content-Length", 0))
+            if size < 0:
+                raise JobError("Invalid Content-Length")
+            if size > _MAX_REQUEST_SIZE:
+                raise JobError(
+                    "Request too large", http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+                )
+            job = self.server.jobs.submit(json.loads(self.rfile.read(size)))
+        except JobError as e:
+            self._send_error(e.status, str(e))
+        except ValueError:
+            self._send_error(http.HTTPStatus.BAD_REQUEST, "A job must be JSON")
+        else:
+            self._send(http.HTTPStatus.CREATED, job)
+
+
+class JobServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], jobs: Jobs):
+        super().__init__(address, _Handler)
+        self.jobs = jobs
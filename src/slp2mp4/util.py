@@ -1,8 +1,14 @@
 # Misc. utilities
 
+import contextlib
+import hashlib
+import os
 import pathlib
 import re
+import signal
 import subprocess
+import sys
+import tempfile
 
 
 def update_dict(d1: dict, d2: dict):
@@ -28,3 +34,52 @@ def natsort(s):
 
 def get_parent_as_path(p):
     return pathlib.Path(p.absolute().parent.parts[-1])
+
+
+def hash_file(path, hasher=None, chunk_size=1024 * 1024):
+    if hasher is None:
+        hasher = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher
+
+
+# Ctrl+C goes to the terminal's whole process group. Processes that handle it
+# themselves (see bin/main.py) or ignore it finish their work when it's
+# pressed, so the children doing that work shouldn't get it either
+def ignores_interrupts() -> bool:
+    return signal.getsignal(signal.SIGINT) is not signal.default_int_handler
+
+
+def get_session_kwargs() -> dict:
+    if sys.platform != "win32" and ignores_interrupts():
+        return {"start_new_session": True}
+    return {}
+
+
+# Gives a temporary file (only readable by its owner) the permissions of a
+# newly created one, before it's published
+def make_public(path):
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(path, 0o666 & ~umask)
+
+
+# Yields a temporary path next to `path`, which replaces `path` only if the
+# block succeeds, so a failed or interrupted write never leaves a truncated
+# file (or destroys a good one)
+# The temporary name is short whatever the length of `path`'s, but keeps its
+# extension, which ffmpeg picks the format by
+@contextlib.contextmanager
+def replacing(path: pathlib.Path):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".slp2mp4-", suffix=path.suffix)
+    os.close(fd)
+    tmp_path = pathlib.Path(tmp)
+    try:
+        yield tmp_path
+        make_public(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            tmp_path.unlink()
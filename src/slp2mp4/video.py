@@ -1,25 +1,103 @@
 # Logic to orchestrate making a video file from a slippi replay
 
+import functools
 import pathlib
 import tempfile
 
 import slp2mp4.ffmpeg as ffmpeg
+import slp2mp4.metrics as metrics
 import slp2mp4.replay as replay
+import slp2mp4.scratch as scratch
 import slp2mp4.dolphin.runner as dolphin_runner
 
 
-# Returns True if the render succeeded, False otherwise
-# output_path must be a container that requires no reencoding, e.g. mkv
-def render(conf, slp_path: pathlib.Path, output_path: pathlib.Path):
-    Ffmpeg = ffmpeg.FfmpegRunner(conf)
-    Dolphin = dolphin_runner.DolphinRunner(conf)
-    with tempfile.TemporaryDirectory() as tmpdir_str:
-        tmpdir = pathlib.Path(tmpdir_str)
-        r = replay.ReplayFile(slp_path)
-        audio_file, video_file = Dolphin.run_dolphin(r, tmpdir)
-        reencoded_audio_file = Ffmpeg.reencode_audio(audio_file)
-        Ffmpeg.merge_audio_and_video(
-            reencoded_audio_file,
-            video_file,
+# ffmpeg muxes the dumps while dolphin is still writing them, so dolphin's
+# progress covers both
+def _render_streaming(Ffmpeg, Dolphin, r, dump_dir, output_path, on_progress):
+    with dolphin_runner.DumpFifos(dump_dir) as fifos:
+        proc = Ffmpeg.start_merge_audio_and_video(
+            fifos.audio_file,
+            fifos.video_file,
             output_path,
         )
+        try:
+            Dolphin.run_dolphin(r, dump_dir, on_progress)
+        except:
+            proc.kill()
+            proc.wait()
+            raise
+        fifos.release()
+        Ffmpeg.wait(proc)
+
+
+# Keeps dolphin's user directory around between renders
+class Renderer:
+    def __init__(self, conf, run_scratch):
+        self.conf = conf
+        self.run_scratch = run_scratch
+        self.Ffmpeg = ffmpeg.FfmpegRunner(conf)
+        self.Dolphin = dolphin_runner.DolphinRunner(conf, run_scratch)
+
+    def __enter__(self):
+        self.Dolphin.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.Dolphin.__exit__(*exc)
+
+    # Raises if the render failed
+    # output_path must be a container that requires no reencoding, e.g. mkv
+    # on_progress is called with (stage, frames done, frames total)
+    # Time spent in each stage is added to timings, if given
+    # Returns the size of the dumps, which only exist while rendering
+    def render(
+        self,
+        slp_path: pathlib.Path,
+        output_path: pathlib.Path,
+        on_progress=None,
+        timings=None,
+    ):
+        if timings is None:
+            timings = {}
+        dolphin_progress = ffmpeg_progress = None
+        with tempfile.TemporaryDirectory(
+            dir=self.run_scratch.get_dir("dumps")
+        ) as tmpdir_str:
+            tmpdir = pathlib.Path(tmpdir_str)
+            r = replay.ReplayFile(slp_path)
+            if on_progress is not None:
+                num_frames = r.get_num_frames()
+                dolphin_progress = functools.partial(on_progress, "dolphin")
+                ffmpeg_progress = lambda seconds: on_progress(
+                    "ffmpeg",
+                    min(int(seconds * replay.FRAMES_PER_SECOND), num_frames),
+                    num_frames,
+                )
+            if self.conf["dolphin"]["stream_dumps"]:
+                with metrics.timed(timings, "stream"):
+                    _render_streaming(
+                        self.Ffmpeg,
+                        self.Dolphin,
+                        r,
+                        tmpdir,
+                        output_path,
+                        dolphin_progress,
+                    )
+                return 0  # The dumps are pipes
+            with metrics.timed(timings, "dolphin"):
+                audio_file, video_file = self.Dolphin.run_dolphin(
+                    r, tmpdir, dolphin_progress
+                )
+            with metrics.timed(timings, "ffmpeg"):
+                self.Ffmpeg.merge_audio_and_video(
+                    audio_file,
+                    video_file,
+                    output_path,
+                    ffmpeg_progress,
+                )
+            return scratch.get_size(tmpdir)
+
+
+def render(conf, slp_path: pathlib.Path, output_path: pathlib.Path):
+    with scratch.open_run(conf) as run_scratch, Renderer(conf, run_scratch) as renderer:
+        renderer.render(slp_path, output_path)
@@ -0,0 +1,276 @@
+# Watches directory trees for replays as they're written, for watch mode
+# On Linux, inotify says which directories changed, so only those are listed
+# again; elsewhere (or with `polling`, e.g. for network shares, where inotify
+# doesn't see remote writes) the trees are listed every poll_interval seconds.
+# A game is finished once Slippi has written its length into the header (see
+# replay.is_complete) and the file has stopped growing. A directory's set is
+# finished once nothing in it has changed for quiet_time seconds; games that
+# never got their length (e.g. Dolphin crashed) are finished along with it.
+# Replays that were last written before the watch started, minus quiet_time,
+# are left alone.
+
+import ctypes
+import ctypes.util
+import dataclasses
+import os
+import pathlib
+import select
+import struct
+import sys
+import time
+
+import slp2mp4.discovery as discovery
+import slp2mp4.replay as replay
+import slp2mp4.util as util
+
+# How long a finished game's size must hold still
+_SETTLE_TIME = 1
+# Longest wait for changes before checking the games again
+_TICK = 1
+
+_IN_MODIFY = 0x2
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_CLOEXEC = 0o2000000
+_IN_NONBLOCK = 0o4000
+_IN_MASK = _IN_MODIFY | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+# wd, mask, cookie, len; followed by the name
+_IN_EVENT = struct.Struct("iIII")
+_IN_BUFFER_SIZE = 64 * 1024
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # wd -> (path, location)
+        self.dirs = {}
+        self.paths = set()
+
+    def add(self, path: pathlib.Path, location: pathlib.Path):
+        wd = self._add_watch(self.fd, os.fsencode(path), _IN_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), str(path))
+        self.dirs[wd] = (path, location)
+        self.paths.add(path)
+
+    def is_watched(self, path: pathlib.Path) -> bool:
+        return path in self.paths
+
+    # Returns the (path, location) of the directories that changed within
+    # timeout seconds, or None if events were lost
+    def read(self, timeout: float):
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+        try:
+            buf = os.read(self.fd, _IN_BUFFER_SIZE)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos < len(buf):
+            wd, mask, _, length = _IN_EVENT.unpack_from(buf, pos)
+            pos += _IN_EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            if mask & _IN_IGNORED:
+                # The directory was removed
+                path, _ = self.dirs.pop(wd, (None, None))
+                self.paths.discard(path)
+            elif wd in self.dirs:
+                changed.add(self.dirs[wd])
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _get_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return _Inotify()
+    except (OSError, AttributeError):
+        return None
+
+
+@dataclasses.dataclass
+class _Game:
+    size: int
+    changed_at: float
+    finished: bool = False
+
+
+@dataclasses.dataclass
+class _Folder:
+    games: dict = dataclasses.field(default_factory=dict)
+    changed_at: float = 0
+    # Has games that aren't part of a finished set yet
+    active: bool = False
+
+
+class Watcher:
+    def __init__(
+        self,
+        roots: list[tuple[pathlib.Path, pathlib.Path]],
+        quiet_time: float,
+        poll_interval: float,
+        polling: bool = False,
+        threads: int = 1,
+    ):
+        self.roots = roots
+        self.quiet_time = quiet_time
+        self.poll_interval = poll_interval
+        self.threads = threads
+        self.inotify = None if polling else _get_inotify()
+        # location -> _Folder
+        self.folders = {}
+        self.next_poll = 0
+        # Anything written before this was there before the watch started
+        self.since = time.time() - quiet_time
+        self._watch(self._scan_roots)
+        self.since = None
+
+    def _stop_inotify(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def _watch(self, scan):
+        try:
+            scan(time.monotonic())
+        except OSError as e:
+            if self.inotify is None:
+                raise
+            # Most likely out of inotify watches
+            print(f"Watching by polling instead of inotify: {e}")
+            self._stop_inotify()
+            self._scan_roots(time.monotonic())
+
+    def close(self):
+        self._stop_inotify()
+
+    def _update(self, found: discovery.Found, now: float):
+        folder = self.folders.setdefault(found.location, _Folder())
+        for slp_path in folder.games.keys() - set(found.slps):
+            del folder.games[slp_path]
+        for slp_path in found.slps:
+            game = folder.games.get(slp_path)
+            if game is not None and game.finished:
+                continue
+            try:
+                stat = slp_path.stat()
+            except OSError:
+                continue  # Removed since listing
+            if game is not None and game.size == stat.st_size:
+                continue
+            if self.since is not None and stat.st_mtime < self.since:
+                folder.games[slp_path] = _Game(stat.st_size, now, finished=True)
+                continue
+            folder.games[slp_path] = _Game(stat.st_size, now)
+            folder.changed_at = now
+            folder.active = True
+
+    # Subdirectories are watched before they're listed, so no replay written
+    # in between is missed
+    def _scan_tree(self, path: pathlib.Path, location: pathlib.Path, now: float):
+        pending = [(location, path)]
+        while pending:
+            sublocation, subdir = pending.pop()
+            try:
+                self.inotify.add(subdir, sublocation)
+                found, subdirs = discovery.scan(subdir, sublocation, False)
+            except (FileNotFoundError, NotADirectoryError):
+                continue  # Removed since listing
+            self._update(found, now)
+            pending.extend(subdirs)
+
+    def _scan_changed(self, changed, now: float):
+        for path, location in changed:
+            try:
+                found, subdirs = discovery.scan(path, location, False)
+            except OSError:
+                continue
+            self._update(found, now)
+            for sublocation, subdir in subdirs:
+                if not self.inotify.is_watched(subdir):
+                    self._scan_tree(subdir, sublocation, now)
+
+    def _scan_roots(self, now: float):
+        for path, location in self.roots:
+            if self.inotify is not None:
+                self._scan_tree(path, location, now)
+                continue
+            for found in discovery.walk(path, location, threads=self.threads):
+                self._update(found, now)
+        self.next_poll = now + self.poll_interval
+
+    @staticmethod
+    def _is_complete(slp_path) -> bool:
+        try:
+            return replay.is_complete(slp_path)
+        except OSError:
+            return False
+
+    # Returns the games of the folder that just finished, in order
+    def _finish_games(self, folder: _Folder, now: float, quiet: bool):
+        finished = []
+        for slp_path, game in folder.games.items():
+            if game.finished:
+                continue
+            if quiet:
+                game.finished = game.size > 0
+            elif now - game.changed_at >= _SETTLE_TIME:
+                game.finished = self._is_complete(slp_path)
+            if game.finished:
+                finished.append(slp_path)
+        return sorted(finished, key=util.natsort)
+
+    def _get_events(self, now: float, check_games: bool):
+        events = []
+        for location, folder in self.folders.items():
+            if not folder.active:
+                continue
+            quiet = now - folder.changed_at >= self.quiet_time
+            if check_games or quiet:
+                slps = self._finish_games(folder, now, quiet)
+                if slps:
+                    events.append(("finished", location, slps))
+            if quiet:
+                folder.active = False
+                events.append(("quiet", location))
+        return events
+
+    # Waits up to a second for changes, and returns what happened as events:
+    #   ("finished", location, slps): games that finished in a directory
+    #   ("quiet", location): the directory's set is finished
+    # A directory can be quiet without having finished games
+    def poll(self) -> list:
+        check_games = True
+        if self.inotify is not None:
+            changed = self.inotify.read(_TICK)
+            if changed is None:
+                self._watch(self._scan_roots)
+            else:
+                self._watch(lambda now: self._scan_changed(changed, now))
+            now = time.monotonic()
+        else:
+            now = time.monotonic()
+            if now < self.next_poll:
+                # Sizes are only known to hold still across polls
+                check_games = False
+                time.sleep(min(_TICK, self.next_poll - now))
+                now = time.monotonic()
+            else:
+                self._scan_roots(now)
+        return self._get_events(now, check_games)
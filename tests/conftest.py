@@ -0,0 +1,30 @@
+import pytest
+
+import slp2mp4.config as config
+import slp2mp4.util as util
+
+
+# Default settings, with a dolphin and ffmpeg that fail every game
+@pytest.fixture
+def failing_conf(tmp_path):
+    failing = tmp_path / "failing"
+    failing.write_text("#!/bin/sh\nexit 1\n")
+    failing.chmod(0o755)
+    iso = tmp_path / "melee.iso"
+    iso.touch()
+    conf = config.get_default_config()
+    util.update_dict(
+        conf,
+        {
+            "paths": {
+                "ffmpeg": str(failing),
+                "slippi_playback": str(failing),
+                "ssbm_iso": str(iso),
+            },
+            "runtime": {"parallel": 1, "retries": 0},
+            "cache": {"enabled": False},
+            "report": {"json": "", "prometheus": ""},
+        },
+    )
+    config.translate_and_validate_config(conf)
+    return conf
@@ -0,0 +1,44 @@
+# Builds minimal replays for the tests
+
+import struct
+
+import slp2mp4.replay as replay
+
+_PAYLOAD_SIZES = {0x36: 0x2FF, 0x37: 0x3F, 0x38: 0x54, 0x3A: 0xC, 0x3C: 0x8}
+STAGE = 31
+CHARACTERS = (2, 20)
+
+
+def _ubjson_string(string: str) -> bytes:
+    data = string.encode()
+    return b"U" + bytes([len(data)]) + data
+
+
+# A replay of the given length, with frames of the right size but no content
+def make_replay(last_frame: int, metadata: bool = True) -> bytes:
+    payloads = bytes([0x35, len(_PAYLOAD_SIZES) * 3 + 1]) + b"".join(
+        struct.pack(">BH", command, size) for command, size in _PAYLOAD_SIZES.items()
+    )
+    game_start = bytearray(_PAYLOAD_SIZES[0x36] + 1)
+    game_start[:4] = bytes([0x36, 3, 14, 0])
+    struct.pack_into(">H", game_start, 0x13, STAGE)
+    for port in range(4):
+        offset = 0x65 + 0x24 * port
+        if port < len(CHARACTERS):
+            game_start[offset : offset + 2] = bytes([CHARACTERS[port], 0])
+        else:
+            game_start[offset : offset + 2] = bytes([0, 3])
+    per_frame = _PAYLOAD_SIZES[0x3A] + _PAYLOAD_SIZES[0x3C] + 2
+    per_frame += len(CHARACTERS) * (_PAYLOAD_SIZES[0x37] + _PAYLOAD_SIZES[0x38] + 2)
+    frames = last_frame - replay.FIRST_FRAME + 1
+    raw = payloads + bytes(game_start) + bytes(per_frame * frames)
+    data = b"{U\x03raw[$U#l" + struct.pack(">i", len(raw) if metadata else 0) + raw
+    if metadata:
+        data += b"U\x08metadata{"
+        data += b"U\x07startAtS" + _ubjson_string("2025-01-01T00:00:00Z")
+        data += b"U\x09lastFramel" + struct.pack(">i", last_frame)
+        data += b"U\x07players{U\x010{U\x05names{"
+        data += b"U\x07netplayS" + _ubjson_string("abc")
+        data += b"U\x04codeS" + _ubjson_string("ABC#123")
+        data += b"}}}}"
+    return data + b"}"
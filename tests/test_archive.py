@@ -0,0 +1,34 @@
+import zipfile
+
+import slp2mp4.archive as archive
+import slp2mp4.replay as replay
+from slp2mp4.archive import ZipMember
+
+from replays import make_replay
+
+
+# Members are read from one open archive, however many there are
+def test_members_share_archive(tmp_path, monkeypatch):
+    path = tmp_path / "replays.zip"
+    with zipfile.ZipFile(path, "w") as zfile:
+        for game in range(3):
+            zfile.writestr(f"set/Game_{game}.slp", make_replay(1000))
+    with zipfile.ZipFile(path) as zfile:
+        members = [
+            ZipMember(path, info.filename, str(path), info) for info in zfile.infolist()
+        ]
+    opened = []
+    zip_file = zipfile.ZipFile
+
+    def open_zip(*args, **kwargs):
+        opened.append(args[0])
+        return zip_file(*args, **kwargs)
+
+    monkeypatch.setattr(zipfile, "ZipFile", open_zip)
+    try:
+        for member in members:
+            assert member.stat().st_size == len(make_replay(1000))
+            assert replay.read_info(member).stage is not None
+    finally:
+        archive.close_archives()
+    assert opened == [path]
@@ -0,0 +1,37 @@
+import pathlib
+
+import slp2mp4.cache as cache
+import slp2mp4.config as config
+
+
+def _make_cache(tmp_path: pathlib.Path) -> cache.RenderCache:
+    conf = config.get_default_config()
+    conf["cache"]["directory"] = tmp_path / "cache"
+    conf["cache"]["max_size"] = 100
+    return cache.RenderCache(conf)
+
+
+# Outputs are overwritten in place by later runs, which mustn't reach the cache
+def test_entries_are_not_shared_with_outputs(tmp_path):
+    render_cache = _make_cache(tmp_path)
+    slp = tmp_path / "Game_1.slp"
+    slp.write_bytes(b"replay")
+    rendered = tmp_path / "rendered.mp4"
+    rendered.write_bytes(b"video")
+    key = render_cache.get_key(slp)
+    render_cache.store(key, rendered)
+    rendered.write_bytes(b"overwritten")
+
+    fetched = tmp_path / "fetched.mp4"
+    assert render_cache.fetch(key, fetched)
+    assert fetched.read_bytes() == b"video"
+    fetched.write_bytes(b"overwritten")
+
+    again = tmp_path / "again.mp4"
+    assert render_cache.fetch(key, again)
+    assert again.read_bytes() == b"video"
+
+
+def test_fetch_misses(tmp_path):
+    render_cache = _make_cache(tmp_path)
+    assert not render_cache.fetch("0" * 64 + ".mp4", tmp_path / "missing.mp4")
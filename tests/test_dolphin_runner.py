@@ -0,0 +1,32 @@
+import slp2mp4.config as config
+import slp2mp4.replay as replay
+from slp2mp4.dolphin.runner import DolphinRunner
+
+
+class _FakeProcess:
+    def __init__(self, lines):
+        self.lines = iter(lines)
+
+    def readline(self, timeout):
+        return next(self.lines, None)
+
+
+# A persistent dolphin's output can still hold the end of the previous replay
+# when the next one is loaded
+def test_wait_for_game_end_skips_previous_replay():
+    runner = DolphinRunner(config.get_default_config(), None)
+    lines = [
+        "[CURRENT_FRAME] 5000\n",
+        "[GAME_END_FRAME] 1000\n",
+        "[CURRENT_FRAME] 10\n",
+        "[CURRENT_FRAME] 1000\n",
+    ]
+    progress = []
+    runner._wait_for_game_end(
+        _FakeProcess(lines), 1124, lambda *args: progress.append(args)
+    )
+    first = replay.FIRST_FRAME
+    assert progress == [
+        (10 - first + 1, 1000 - first + 1),
+        (1000 - first + 1, 1000 - first + 1),
+    ]
@@ -0,0 +1,95 @@
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from replays import make_replay
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parents[1] / "benchmarks"
+SRC_DIR = pathlib.Path(__file__).resolve().parents[1] / "src"
+
+# Watches a directory like the command line does, stopping on Ctrl+C, and says
+# when its game has started rendering
+_DRIVER = """
+import pathlib
+import signal
+import sys
+
+import slp2mp4.config as config
+import slp2mp4.scratch as scratch
+import slp2mp4.util as util
+from slp2mp4.modes.watch import Watch
+
+tmp_path = pathlib.Path(sys.argv[1])
+bench_dir = pathlib.Path(sys.argv[2])
+conf = config.get_default_config()
+util.update_dict(
+    conf,
+    {
+        "paths": {
+            "ffmpeg": str(bench_dir / "fake_ffmpeg.py"),
+            "slippi_playback": str(bench_dir / "fake_dolphin.py"),
+            "ssbm_iso": str(tmp_path / "melee.iso"),
+        },
+        "dolphin": {"stream_dumps": True},
+        "runtime": {"parallel": 1, "retries": 0},
+        "cache": {"enabled": False},
+        "report": {"json": "", "prometheus": ""},
+        "watch": {"quiet_time": 60, "poll_interval": 0.1},
+    },
+)
+config.translate_and_validate_config(conf)
+mode = Watch([tmp_path / "replays"], tmp_path / "out")
+mode.conf = conf
+signal.signal(signal.SIGINT, lambda *_: mode.stop())
+started = False
+
+
+def report(progress):
+    global started
+    if not started and any(game.done for game in progress.games.values()):
+        started = True
+        print("rendering", flush=True)
+
+
+with scratch.open_run(conf) as mode.scratch:
+    result = mode._run(False, False, report)
+print(result, flush=True)
+"""
+
+
+# Ctrl+C reaches every process in the terminal's process group, but watch
+# mode still finishes the game it was rendering
+@pytest.mark.skipif(sys.platform == "win32", reason="needs process groups")
+def test_interrupt_mid_render(tmp_path):
+    (tmp_path / "melee.iso").touch()
+    (tmp_path / "replays" / "set").mkdir(parents=True)
+    slp_path = tmp_path / "replays" / "set" / "Game_1.slp"
+    slp_path.write_bytes(make_replay(1000))
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SRC_DIR),
+        "SLP2MP4_FAKE_FPS": "300",
+        "SLP2MP4_FAKE_BOOT": "0",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-c", _DRIVER, str(tmp_path), str(BENCH_DIR)],
+        stdout=subprocess.PIPE,
+        text=True,
+        env=env,
+        start_new_session=True,
+    )
+    try:
+        assert proc.stdout.readline() == "rendering\n"
+        os.killpg(proc.pid, signal.SIGINT)
+        output, _ = proc.communicate(timeout=60)
+    finally:
+        if proc.poll() is None:
+            os.killpg(proc.pid, signal.SIGKILL)
+    assert proc.returncode == 0
+    assert output.splitlines()[-1] == "None"
+    video = tmp_path / "out" / "replays_set.mp4"
+    assert str(slp_path).encode() in video.read_bytes()
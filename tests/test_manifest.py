@@ -0,0 +1,31 @@
+import os
+
+import slp2mp4.manifest as manifest
+from slp2mp4.output import Output
+
+
+# An input that changes while its output is being written makes the output
+# out of date
+def test_input_changed_during_run(tmp_path):
+    slp_path = tmp_path / "Game_1.slp"
+    slp_path.write_bytes(b"old")
+    output = Output([slp_path], tmp_path / "set.mp4")
+    outputs_manifest = manifest.Manifest(tmp_path, "fingerprint")
+    records = outputs_manifest.get_records(output)
+    slp_path.write_bytes(b"new")
+    os.utime(slp_path, ns=(0, 0))
+    output.output.write_bytes(b"video")
+    outputs_manifest.update(output, records)
+    outputs_manifest.save()
+    assert not manifest.Manifest(tmp_path, "fingerprint").is_up_to_date(output)
+
+
+def test_unchanged_input(tmp_path):
+    slp_path = tmp_path / "Game_1.slp"
+    slp_path.write_bytes(b"old")
+    output = Output([slp_path], tmp_path / "set.mp4")
+    outputs_manifest = manifest.Manifest(tmp_path, "fingerprint")
+    output.output.write_bytes(b"video")
+    outputs_manifest.update(output, outputs_manifest.get_records(output))
+    outputs_manifest.save()
+    assert manifest.Manifest(tmp_path, "fingerprint").is_up_to_date(output)
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import slp2mp4.memory as memory
+
+_MB = 1024 * 1024
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs /proc")
+def test_descendants_rss():
+    child = subprocess.Popen(["sleep", "10"])
+    try:
+        usages = memory.get_descendants_rss([os.getpid(), child.pid])
+    finally:
+        child.kill()
+        child.wait()
+    assert usages[os.getpid()] > 0
+    assert usages[child.pid] == 0
+
+
+# One large sample (e.g. a render measured along with something else) doesn't
+# set the reservation for the rest of the run
+def test_reservation_ignores_outliers(monkeypatch):
+    usages = iter([{1: 100 * _MB}] * 40 + [{1: 1000 * _MB}])
+    monkeypatch.setattr(memory, "get_descendants_rss", lambda pids: next(usages))
+    budget = memory.MemoryBudget(1000, 300 * _MB)
+    assert budget.get_reservation() == 300 * _MB
+    for _ in range(41):
+        budget.last_sample = 0
+        budget.sample([1])
+    budget.on_rendered()
+    assert budget.get_reservation() == 100 * _MB
+    assert budget.usage == 1000 * _MB
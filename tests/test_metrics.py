@@ -0,0 +1,12 @@
+import slp2mp4.metrics as metrics
+
+
+# Cache hits count towards the run's throughput, but not dolphin's
+def test_dolphin_frames_per_second():
+    report = metrics.RunReport({"a.slp": 600, "b.slp": 600, "c.slp": 6000})
+    report.on_rendered("set.mp4", "a.slp", {"dolphin": 10, "total": 11}, 0)
+    report.on_rendered("set.mp4", "b.slp", {"stream": 5, "total": 5}, 0)
+    report.on_rendered("set.mp4", "c.slp", {"cache": 0.1, "total": 0.1}, 0)
+    summary = report.finish([])
+    assert summary["frames"] == 7200
+    assert summary["dolphin_frames_per_second"] == 1200 / 15
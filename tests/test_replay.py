@@ -0,0 +1,61 @@
+import zipfile
+
+import pytest
+
+import slp2mp4.replay as replay
+from slp2mp4.archive import ZipMember
+
+from replays import CHARACTERS, STAGE, make_replay
+
+
+def test_complete_replay(tmp_path):
+    slp_path = tmp_path / "Game_1.slp"
+    slp_path.write_bytes(make_replay(1000))
+    info = replay.read_info(slp_path)
+    assert info.num_frames == 1124
+    assert info.stage == STAGE
+    assert info.version == (3, 14, 0)
+    assert [player.character for player in info.players] == list(CHARACTERS)
+    assert info.players[0].name == "abc"
+    assert info.players[0].code == "ABC#123"
+    assert info.start_at == "2025-01-01T00:00:00Z"
+    assert replay.is_complete(slp_path)
+
+
+# Replays still being written (or from a crashed Dolphin) have no length or
+# metadata, so their length is estimated from their size
+def test_replay_without_metadata(tmp_path):
+    slp_path = tmp_path / "Game_1.slp"
+    slp_path.write_bytes(make_replay(1000, metadata=False))
+    info = replay.read_info(slp_path)
+    assert info.last_frame is None
+    assert info.start_at is None
+    assert abs(info.num_frames - 1124) <= 2
+    assert not replay.is_complete(slp_path)
+
+
+@pytest.mark.parametrize("size", [0, 8, 20, 200])
+def test_truncated_replay(tmp_path, size):
+    slp_path = tmp_path / "Game_1.slp"
+    slp_path.write_bytes(make_replay(1000)[:size])
+    with pytest.raises(replay.ReplayParseError):
+        replay.read_info(slp_path)
+
+
+def test_not_a_replay(tmp_path):
+    slp_path = tmp_path / "Game_1.slp"
+    slp_path.write_bytes(b"PK\x03\x04" + bytes(100))
+    with pytest.raises(replay.ReplayParseError):
+        replay.read_info(slp_path)
+
+
+# Zip members can't be mapped, so only their header is read
+def test_replay_in_zip(tmp_path):
+    archive = tmp_path / "replays.zip"
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zfile:
+        zfile.writestr("set/Game_1.slp", make_replay(1000))
+    member = ZipMember(archive, "set/Game_1.slp", str(archive))
+    info = replay.read_info(member)
+    assert info.stage == STAGE
+    assert [player.character for player in info.players] == list(CHARACTERS)
+    assert abs(info.num_frames - 1124) <= 2
@@ -0,0 +1,33 @@
+import os
+import time
+
+import slp2mp4.scratch as scratch
+
+
+def _make_run_dir(root, name, age=0):
+    run_dir = root / f"slp2mp4-{name}"
+    run_dir.mkdir()
+    mtime = time.time() - age
+    os.utime(run_dir, (mtime, mtime))
+    return run_dir
+
+
+# A run's directory has no lock yet right after it's made
+def test_clean_up_without_lock(tmp_path):
+    new = _make_run_dir(tmp_path, "new")
+    old = _make_run_dir(tmp_path, "old", age=scratch._LOCK_GRACE + 10)
+    scratch.clean_up(tmp_path)
+    assert new.exists()
+    assert not (new / scratch._LOCK_NAME).exists()
+    assert not old.exists()
+
+
+def test_clean_up_with_lock(tmp_path):
+    running = _make_run_dir(tmp_path, "running", age=scratch._LOCK_GRACE + 10)
+    crashed = _make_run_dir(tmp_path, "crashed", age=scratch._LOCK_GRACE + 10)
+    (crashed / scratch._LOCK_NAME).touch()
+    with open(running / scratch._LOCK_NAME, "a") as lock:
+        assert scratch._try_lock(lock)
+        scratch.clean_up(tmp_path)
+    assert running.exists()
+    assert not crashed.exists()
@@ -0,0 +1,98 @@
+import json
+import threading
+import urllib.error
+import time
+import urllib.request
+
+import pytest
+
+import slp2mp4.orchestrator as orchestrator
+import slp2mp4.scratch as scratch
+from slp2mp4.modes.serve import Serve
+
+from replays import make_replay
+
+
+def _request(address, path, data=None):
+    url = f"http://{address[0]}:{address[1]}{path}"
+    if data is not None:
+        data = json.dumps(data).encode()
+    with urllib.request.urlopen(url, data, timeout=10) as response:
+        return response.status, json.loads(response.read())
+
+
+def test_failed_job(tmp_path, failing_conf):
+    failing_conf["serve"]["port"] = 0
+    (tmp_path / "replays").mkdir()
+    slp_path = tmp_path / "replays" / "Game_1.slp"
+    slp_path.write_bytes(make_replay(100))
+    mode = Serve([tmp_path / "replays"], tmp_path / "out")
+    mode.conf = failing_conf
+    with scratch.open_run(failing_conf) as mode.scratch:
+        thread = threading.Thread(target=mode._run, args=(False, False, None))
+        thread.start()
+        try:
+            deadline = time.monotonic() + 30
+            while mode.address is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+            status, job = _request(
+                mode.address, "/jobs", {"inputs": [str(slp_path)], "output": "game"}
+            )
+            assert status == 201
+            assert job["output"] == str(tmp_path / "out" / "game.mp4")
+            while job["state"] not in ("done", "failed"):
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+                _, job = _request(mode.address, f"/jobs/{job['id']}")
+        finally:
+            mode.stop()
+            thread.join()
+    assert job["state"] == "failed"
+    assert job["error"]
+    assert [failure.slp for failure in mode.failures] == [slp_path]
+
+
+# Jobs aren't left queued forever if rendering stops working
+def test_pipeline_crash(tmp_path, failing_conf, monkeypatch):
+    crash = threading.Event()
+
+    def run(self):
+        crash.wait(30)
+        raise RuntimeError("crashed")
+
+    monkeypatch.setattr(orchestrator.Pipeline, "run", run)
+    failing_conf["serve"]["port"] = 0
+    (tmp_path / "replays").mkdir()
+    slp_path = tmp_path / "replays" / "Game_1.slp"
+    slp_path.write_bytes(make_replay(100))
+    mode = Serve([tmp_path / "replays"], tmp_path / "out")
+    mode.conf = failing_conf
+    errors = []
+
+    def serve():
+        try:
+            mode._run(False, False, None)
+        except RuntimeError as e:
+            errors.append(e)
+
+    with scratch.open_run(failing_conf) as mode.scratch:
+        thread = threading.Thread(target=serve)
+        thread.start()
+        try:
+            deadline = time.monotonic() + 30
+            while mode.address is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+            address = mode.address
+            _, job = _request(
+                address, "/jobs", {"inputs": [str(slp_path)], "output": "game"}
+            )
+            crash.set()
+            thread.join(30)
+        finally:
+            crash.set()
+            mode.stop()
+            thread.join()
+    assert [str(e) for e in errors] == ["crashed"]
+    assert mode.jobs.get_job(str(job["id"]))["state"] == "failed"
+    with pytest.raises(urllib.error.URLError):
+        _request(address, "/jobs", {"inputs": [str(slp_path)], "output": "game"})
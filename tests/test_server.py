@@ -0,0 +1,26 @@
+import socket
+import threading
+
+import pytest
+
+import slp2mp4.server as server
+
+
+@pytest.fixture
+def address(tmp_path):
+    jobs = server.Jobs([tmp_path], tmp_path / "out", lambda output, priority: None)
+    httpd = server.JobServer(("127.0.0.1", 0), jobs)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("length", ["-1", "abc"])
+def test_bad_content_length(address, length):
+    with socket.create_connection(address, timeout=5) as sock:
+        sock.sendall(
+            f"POST /jobs HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n".encode()
+        )
+        assert sock.recv(1024).startswith(b"HTTP/1.0 400")
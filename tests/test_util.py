@@ -0,0 +1,48 @@
+import os
+import stat
+import tempfile
+
+import slp2mp4.util as util
+
+
+def test_make_public(tmp_path):
+    fd, tmp = tempfile.mkstemp(dir=tmp_path)
+    os.close(fd)
+    umask = os.umask(0o022)
+    try:
+        util.make_public(tmp)
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(tmp).st_mode) == 0o644
+
+
+def test_replacing(tmp_path):
+    path = tmp_path / "set.mp4"
+    path.write_bytes(b"old")
+    with util.replacing(path) as tmp:
+        tmp.write_bytes(b"new")
+        assert path.read_bytes() == b"old"
+    assert path.read_bytes() == b"new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+# A failed write leaves the previous file alone
+def test_replacing_failed(tmp_path):
+    path = tmp_path / "set.mp4"
+    path.write_bytes(b"old")
+    try:
+        with util.replacing(path) as tmp:
+            tmp.write_bytes(b"partial")
+            raise OSError
+    except OSError:
+        pass
+    assert path.read_bytes() == b"old"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+# Names that are fine for the output must be fine for its temporary file too
+def test_replacing_long_name(tmp_path):
+    path = tmp_path / ("a" * 251 + ".mp4")
+    with util.replacing(path) as tmp:
+        tmp.write_bytes(b"new")
+    assert path.read_bytes() == b"new"
@@ -0,0 +1,43 @@
+import threading
+
+import slp2mp4.scratch as scratch
+import slp2mp4.util as util
+from slp2mp4.modes.watch import Watch
+
+from replays import make_replay
+
+
+# Watches tmp_path / "replays"
+def _make_watch(tmp_path, conf):
+    util.update_dict(conf, {"watch": {"quiet_time": 60, "poll_interval": 0.1}})
+    (tmp_path / "replays" / "set").mkdir(parents=True)
+    mode = Watch([tmp_path / "replays"], tmp_path / "out")
+    mode.conf = conf
+    return mode
+
+
+# Sets are only sealed once their directory goes quiet, but can fail before
+def test_game_fails_before_set_is_quiet(tmp_path, failing_conf):
+    mode = _make_watch(tmp_path, failing_conf)
+    (tmp_path / "replays" / "set" / "Game_1.slp").write_bytes(make_replay(100))
+    set_done = threading.Event()
+    on_set_done = mode._on_set_done
+
+    def record_set_done(*args):
+        on_set_done(*args)
+        set_done.set()
+
+    mode._on_set_done = record_set_done
+    result = []
+    with scratch.open_run(mode.conf) as mode.scratch:
+        thread = threading.Thread(
+            target=lambda: result.append(mode._run(False, False, None))
+        )
+        thread.start()
+        try:
+            assert set_done.wait(30)
+        finally:
+            mode.stop()
+            thread.join()
+    assert [failure.slp.name for failure in mode.failures] == ["Game_1.slp"]
+    assert result[0] is not None